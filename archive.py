@@ -0,0 +1,102 @@
+"""Cold storage for old jobs: `flask archive-jobs` and `flask restore-jobs`.
+
+Completed, fully paid jobs older than ARCHIVE_AFTER_DAYS move with their payments to job_archive/
+payment_archive, keeping their ids, so the hot tables (listing, search, balances) stay small while
+job pages, invoices, customer history, exports and reports still see them. The ledger is untouched:
+archived rows are history that already happened.
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, current_app
+from sqlalchemy import literal, select
+
+from models import Job, JobArchive, Payment, PaymentArchive, bump_data_version, db
+
+bp = Blueprint('archive', __name__, cli_group=None)
+
+ARCHIVE_BATCH_SIZE = 500
+
+def archive_candidates(before, limit=None):
+    # ids are never handed out again (see Job), so any old enough job can go, the newest included
+    q = (select(Job.id)
+         .where(Job.status == 'completed', Job.completed_at < before, Job.balance_due <= 0.005)
+         .order_by(Job.id))
+    if limit:
+        q = q.limit(limit)
+    return db.session.execute(q).scalars().all()
+
+def move_jobs(conn, ids, jobs, payments):
+    # jobs/payments: (source table, destination table); rows are copied with INSERT ... SELECT, then deleted
+    (job_src, job_dst), (pay_src, pay_dst) = jobs, payments
+    now = datetime.utcnow()
+    for src, dst, key in ((job_src, job_dst, 'id'), (pay_src, pay_dst, 'job_id')):
+        names = [c.name for c in dst.columns if c.name in src.c]
+        cols = [src.c[n] for n in names]
+        if 'archived_at' in dst.c and 'archived_at' not in src.c:
+            names.append('archived_at')
+            cols.append(literal(now, db.DateTime))
+        conn.execute(dst.insert().from_select(names, select(*cols).where(src.c[key].in_(ids))))
+    conn.execute(pay_src.delete().where(pay_src.c.job_id.in_(ids)))
+    return conn.execute(job_src.delete().where(job_src.c.id.in_(ids))).rowcount
+
+def archive_jobs(before, batch_size=ARCHIVE_BATCH_SIZE):
+    # one transaction per batch, so a long first run does not hold the write lock for long
+    moved = 0
+    while True:
+        ids = archive_candidates(before, batch_size)
+        if not ids:
+            return moved
+        conn = db.session.connection()
+        moved += move_jobs(conn, ids, (Job.__table__, JobArchive.__table__),
+                           (Payment.__table__, PaymentArchive.__table__))
+        bump_data_version(conn)
+        db.session.commit()
+
+def restore_jobs(ids):
+    # back to the hot tables (e.g. a warranty repair on an archived job). A job is left archived,
+    # and returned as {job id: reason}, when a live job or payment already has its id or one of its
+    # payments' ids (possible in databases from before migration 14)
+    ids = db.session.execute(select(JobArchive.id).where(JobArchive.id.in_(ids))).scalars().all()
+    clash = {}
+    if ids:
+        for job_id in db.session.execute(select(Job.id).where(Job.id.in_(ids))).scalars():
+            clash[job_id] = "a live job already has this id"
+        taken = (select(PaymentArchive.job_id).join(Payment, Payment.id == PaymentArchive.id)
+                 .where(PaymentArchive.job_id.in_(ids)))
+        for job_id in db.session.execute(taken).scalars():
+            clash.setdefault(job_id, "a live payment already has the id of one of its payments")
+    ids = [i for i in ids if i not in clash]
+    if not ids:
+        return 0, clash
+    conn = db.session.connection()
+    restored = move_jobs(conn, ids, (JobArchive.__table__, Job.__table__),
+                         (PaymentArchive.__table__, Payment.__table__))
+    bump_data_version(conn)
+    db.session.commit()
+    return restored, clash
+
+@bp.cli.command('archive-jobs')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='Archive jobs completed before this day')
+@click.option('--days', type=int, help='Archive jobs completed more than this many days ago (default: ARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Only count the jobs that would be archived')
+def archive_jobs_command(before, days, batch_size, dry_run):
+    """Move old completed, fully paid jobs and their payments to the archive tables."""
+    if before is None:
+        days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+        before = datetime.utcnow() - timedelta(days=days)
+    if dry_run:
+        click.echo(f"{len(archive_candidates(before))} job(s) completed before {before:%Y-%m-%d} would be archived.")
+        return
+    n = archive_jobs(before, batch_size)
+    click.echo(f"Archived {n} job(s) completed before {before:%Y-%m-%d}.")
+
+@bp.cli.command('restore-jobs')
+@click.argument('job_ids', nargs=-1, type=int, required=True)
+def restore_jobs_command(job_ids):
+    """Move archived jobs (and their payments) back to the hot tables."""
+    n, clash = restore_jobs(job_ids)
+    for job_id, reason in sorted(clash.items()):
+        click.echo(f"job {job_id}: {reason}; left in the archive", err=True)
+    click.echo(f"Restored {n} job(s).")
@@ -0,0 +1,296 @@
+"""Benchmark the hot routes and save p50/p95/p99 latency, throughput and peak RSS as JSON.
+
+    python bench/seed_data.py --scale medium
+    python bench/run_bench.py                                  # in-process Flask test client
+    python bench/run_bench.py --mode gunicorn --concurrency 8  # real server from gunicorn.conf.py
+    python bench/run_bench.py --compare bench/results/<earlier>.json
+
+Results land in bench/results/ named by time, mode and commit. --compare prints the
+change against an earlier run of the same routes.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+
+# name: (path, default request count); {job_id} is filled with a random existing job
+ROUTES = {
+    'jobs': ('/jobs', 200),
+    'jobs_search': ('/jobs/search?q=samsung', 100),
+    'job_detail': ('/job/{job_id}', 200),
+    'invoice_html': ('/job/{job_id}/invoice', 200),
+    'daily_summary': ('/api/daily_summary', 200),
+    'export_jobs_csv': ('/export_jobs.csv', 5),
+}
+
+
+def percentile(sorted_values, pct):
+    # nearest-rank
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def summarize(latencies, errors, wall, nbytes):
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000, 2) if v is not None else None
+    return {
+        'requests': len(lat),
+        'errors': errors,
+        'p50_ms': ms(percentile(lat, 50)),
+        'p95_ms': ms(percentile(lat, 95)),
+        'p99_ms': ms(percentile(lat, 99)),
+        'mean_ms': ms(sum(lat) / len(lat)) if lat else None,
+        'max_ms': ms(lat[-1]) if lat else None,
+        'throughput_rps': round(len(lat) / wall, 2) if wall else None,
+        'avg_bytes': nbytes // len(lat) if lat else 0,
+    }
+
+
+def drive(fetch, paths, concurrency):
+    """Run fetch(path) -> (status, nbytes) over paths on `concurrency` threads."""
+    latencies, errors, nbytes = [], 0, 0
+    lock = threading.Lock()
+    queue = list(paths)
+
+    def worker():
+        nonlocal errors, nbytes
+        while True:
+            with lock:
+                if not queue:
+                    return
+                path = queue.pop()
+            start = time.perf_counter()
+            try:
+                status, size = fetch(path)
+            except Exception:
+                status, size = 599, 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                nbytes += size
+                if status >= 400:
+                    errors += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - started, nbytes
+
+
+def rss_mb(pid='self'):
+    # peak resident set size (VmHWM) of one process, Linux only
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as fh:
+            return [int(p) for p in fh.read().split()]
+    except OSError:
+        return []
+
+
+class ClientTarget:
+    mode = 'client'
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def fetch(self, path):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        resp = client.get(path)
+        size = len(resp.get_data())  # drains streamed bodies too
+        resp.close()
+        return resp.status_code, size
+
+    def peak_rss(self):
+        return {'process_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    mode = 'gunicorn'
+
+    def __init__(self, port, env):
+        self.base = f'http://127.0.0.1:{port}'
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'app:create_app()'],
+            cwd=ROOT, env=dict(env, PORT=str(port)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        self.close()
+        raise SystemExit('gunicorn did not start listening within 30s')
+
+    def fetch(self, path):
+        try:
+            with urllib.request.urlopen(self.base + path, timeout=300) as resp:
+                size = 0
+                while True:
+                    chunk = resp.read(65536)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                return resp.status, size
+        except urllib.error.HTTPError as exc:
+            return exc.code, 0
+
+    def peak_rss(self):
+        workers = [rss_mb(pid) for pid in child_pids(self.proc.pid)]
+        workers = [w for w in workers if w is not None]
+        return {'master_mb': rss_mb(self.proc.pid), 'workers_mb': workers,
+                'total_mb': round(sum(workers) + (rss_mb(self.proc.pid) or 0), 1)}
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    with open(previous_path) as fh:
+        previous = json.load(fh)
+    print(f"\nvs {os.path.basename(previous_path)} ({previous['meta'].get('commit')})")
+    print(f"{'route':<18}{'p50 ms':>18}{'p95 ms':>18}{'rps':>18}")
+    for name, now in current['routes'].items():
+        before = previous['routes'].get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'throughput_rps'):
+            old, new = before.get(key), now.get(key)
+            change = f"{(new - old) / old * 100:+.0f}%" if old and new is not None else 'n/a'
+            cells.append(f"{new} ({change})")
+        print(f"{name:<18}" + ''.join(f"{c:>18}" for c in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--db', default=os.path.join(ROOT, 'bench', 'bench.db'),
+                        help='SQLite file made by seed_data.py (ignored when DATABASE_URL is set)')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--requests', type=int, help='requests per route (default: per-route, see ROUTES)')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests per route first')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='result file (default: bench/results/<time>-<mode>-<commit>.json)')
+    parser.add_argument('--compare', metavar='JSON', help='earlier result to diff against')
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.routes.split(',') if n.strip()]
+    unknown = [n for n in names if n not in ROUTES]
+    if unknown:
+        parser.error(f"unknown route(s): {', '.join(unknown)}")
+
+    env = dict(os.environ)
+    if not env.get('DATABASE_URL'):
+        if not os.path.exists(args.db):
+            parser.error(f"{args.db} not found; run bench/seed_data.py first")
+        env['SQLITE_PATH'] = os.environ['SQLITE_PATH'] = os.path.abspath(args.db)
+
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from models import db, Job
+    app = create_app()
+    with app.app_context():
+        job_ids = [row[0] for row in db.session.query(Job.id).all()]
+        database = db.engine.url.render_as_string(hide_password=True)
+    if not job_ids:
+        parser.error('database has no jobs; run bench/seed_data.py first')
+
+    rng = random.Random(args.seed)
+    target = ClientTarget(app) if args.mode == 'client' else GunicornTarget(args.port, env)
+    results = {}
+    try:
+        for name in names:
+            template, default_n = ROUTES[name]
+            n = args.requests or default_n
+            paths = [template.format(job_id=rng.choice(job_ids)) for _ in range(n)]
+            drive(target.fetch, paths[:args.warmup], 1)
+            latencies, errors, wall, nbytes = drive(target.fetch, paths, args.concurrency)
+            results[name] = summarize(latencies, errors, wall, nbytes)
+            results[name]['peak_rss'] = target.peak_rss()
+            r = results[name]
+            print(f"{name:<18} n={r['requests']:<5} p50={r['p50_ms']}ms p95={r['p95_ms']}ms "
+                  f"p99={r['p99_ms']}ms {r['throughput_rps']} req/s errors={errors}")
+    finally:
+        target.close()
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'commit': commit,
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'database': database,
+            'jobs': len(job_ids),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'routes': results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{args.mode}-{commit or 'nogit'}.json")
+    with open(output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Saved {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
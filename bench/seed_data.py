@@ -0,0 +1,208 @@
+"""Fill a database with synthetic customers, jobs, payments and expenses for benchmarking.
+
+    python bench/seed_data.py --scale medium              # 100k jobs into bench/bench.db
+    python bench/seed_data.py --jobs 5000 --db /tmp/x.db
+
+The data is deterministic for a given --seed, --jobs and day (history ends today, so the
+daily summaries have data), so runs on different commits see the same database. Rows go in with Core executemany (no per-row mapper events);
+paid_total/balance_due and the daily ledger are rebuilt once at the end.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = {'small': 1_000, 'medium': 100_000, 'large': 1_000_000}
+BATCH = 10_000
+
+AREAS = ['Andheri', 'Bandra', 'Borivali', 'Dadar', 'Ghatkopar', 'Goregaon', 'Kandivali', 'Kurla',
+         'Malad', 'Mulund', 'Powai', 'Santacruz', 'Thane', 'Vashi', 'Vile Parle', 'Worli']
+BRANDS = ['Samsung', 'LG', 'Sony', 'Panasonic', 'TCL', 'Mi', 'OnePlus', 'Videocon', 'Onida', 'Philips']
+SIZES = ['24"', '32"', '40"', '43"', '50"', '55"', '65"']
+REPAIRS = ['Backlight strip replaced', 'Power board repair', 'Panel replacement', 'Mainboard reflow',
+           'No display - T-con board', 'Sound issue - speaker replaced', 'Remote sensor fixed',
+           'Firmware update and reset', 'HDMI port replaced', 'Vertical lines on screen']
+NOTES = ['', '', '', 'Customer will collect on Sunday', 'Urgent', 'Warranty repair', 'Call before delivery']
+FIRST = ['Amit', 'Priya', 'Rahul', 'Sneha', 'Vikas', 'Anita', 'Suresh', 'Kavita', 'Rohan', 'Pooja',
+         'Manoj', 'Neha', 'Arjun', 'Deepa', 'Sanjay', 'Meena', 'Ravi', 'Sunita', 'Ajay', 'Geeta']
+LAST = ['Sharma', 'Patil', 'Shah', 'Iyer', 'Desai', 'Kulkarni', 'Joshi', 'Mehta', 'Nair', 'Yadav']
+PAYMENT_MODES = ['cash', 'cash', 'cash', 'upi', 'upi', 'card']
+EXPENSE_ITEMS = ['Spare parts', 'Transport', 'Shop rent', 'Electricity', 'Tea and snacks', 'Tools']
+
+
+def zipf_weights(n, s=1.1):
+    # a few areas/brands get most of the work, like real shop data
+    return [1 / (k ** s) for k in range(1, n + 1)]
+
+
+def job_time(rng, start, days):
+    # more jobs in recent months, fewer on Sundays, shop hours 10:00-20:00
+    while True:
+        day = int(days * math.sqrt(rng.random()))
+        when = start + timedelta(days=day)
+        if when.weekday() != 6 or rng.random() < 0.3:
+            break
+    return datetime.combine(when, datetime.min.time()) + timedelta(seconds=rng.randint(10 * 3600, 20 * 3600))
+
+
+def generate(session, tables, jobs, days, seed, log=print):
+    from models import normalize_phone
+
+    rng = random.Random(seed)
+    end = date.today()
+    start = end - timedelta(days=days - 1)
+    area_w, brand_w = zipf_weights(len(AREAS)), zipf_weights(len(BRANDS))
+
+    # roughly one customer per three jobs; repeat customers come back
+    n_customers = max(1, jobs // 3)
+    rows, phones = [], set()
+    for i in range(n_customers):
+        name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+        phone = f"9{rng.randrange(10**8, 10**9)}"
+        while phone in phones:  # phone_normalized is unique: one customer per number
+            phone = f"9{rng.randrange(10**8, 10**9)}"
+        phones.add(phone)
+        rows.append({
+            'id': i + 1,
+            'name': name,
+            'phone': phone,
+            'phone_normalized': normalize_phone(phone),
+            'address': f"{rng.randint(1, 300)}, {rng.choices(AREAS, area_w)[0]}",
+            'created_at': job_time(rng, start, days),
+        })
+        if len(rows) == BATCH:
+            session.execute(tables['customer'].insert(), rows)
+            rows = []
+    if rows:
+        session.execute(tables['customer'].insert(), rows)
+    session.commit()
+    log(f"  {n_customers} customers")
+
+    payment_id = 0
+    job_rows, payment_rows = [], []
+    for job_id in range(1, jobs + 1):
+        created = job_time(rng, start, days)
+        age = (datetime.combine(end, datetime.min.time()) - created).days
+        amount = round(max(200.0, rng.lognormvariate(7.6, 0.6)) / 50) * 50
+        completed_at = None
+        status = 'received'
+        if age > 14 or rng.random() < 0.6:
+            status = 'completed'
+            completed_at = min(created + timedelta(days=rng.randint(0, 10), hours=rng.randint(0, 6)),
+                               datetime.combine(end, datetime.min.time()) + timedelta(hours=20))
+        elif rng.random() < 0.5:
+            status = 'in_progress'
+        job_rows.append({
+            'id': job_id,
+            'customer_id': rng.randint(1, n_customers),
+            'area': rng.choices(AREAS, area_w)[0],
+            'tv_model': f"{rng.choices(BRANDS, brand_w)[0]} {rng.choice(SIZES)}",
+            'repair_work': rng.choice(REPAIRS),
+            'amount_charged': amount,
+            'expense': round(amount * rng.uniform(0.1, 0.5) / 10) * 10,
+            'payment_mode': rng.choice(PAYMENT_MODES),
+            'pickup_date': None,
+            'note': rng.choice(NOTES),
+            'status': status,
+            'created_at': created,
+            'completed_at': completed_at,
+        })
+        # advance at drop-off, the rest at pickup; ~15% of completed jobs still owe money
+        paid_at = completed_at or created
+        if rng.random() < 0.4:
+            advance = round(amount * rng.choice([0.2, 0.3, 0.5]) / 50) * 50
+            payment_id += 1
+            payment_rows.append({'id': payment_id, 'job_id': job_id, 'amount': advance,
+                                 'payment_mode': rng.choice(PAYMENT_MODES), 'note': 'advance',
+                                 'payment_date': created})
+        else:
+            advance = 0
+        if completed_at and rng.random() < 0.85 and amount - advance > 0:
+            payment_id += 1
+            payment_rows.append({'id': payment_id, 'job_id': job_id, 'amount': amount - advance,
+                                 'payment_mode': rng.choice(PAYMENT_MODES), 'note': None,
+                                 'payment_date': paid_at})
+        if len(job_rows) == BATCH:
+            session.execute(tables['job'].insert(), job_rows)
+            if payment_rows:
+                session.execute(tables['payment'].insert(), payment_rows)
+            session.commit()
+            job_rows, payment_rows = [], []
+            log(f"  {job_id} jobs")
+    if job_rows:
+        session.execute(tables['job'].insert(), job_rows)
+    if payment_rows:
+        session.execute(tables['payment'].insert(), payment_rows)
+    session.commit()
+    log(f"  {jobs} jobs, {payment_id} payments")
+
+    expense_rows = []
+    for day in range(days):
+        for _ in range(rng.randint(0, max(1, jobs // days // 10))):
+            expense_rows.append({'description': rng.choice(EXPENSE_ITEMS),
+                                 'amount': round(rng.lognormvariate(5.5, 0.8) / 10) * 10,
+                                 'date': start + timedelta(days=day),
+                                 'created_at': datetime.combine(start + timedelta(days=day), datetime.min.time())})
+    if expense_rows:
+        session.execute(tables['expense'].insert(), expense_rows)
+    session.commit()
+    log(f"  {len(expense_rows)} expenses")
+    return {'customers': n_customers, 'jobs': jobs, 'payments': payment_id, 'expenses': len(expense_rows)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--scale', choices=sorted(SCALES), default='small')
+    size.add_argument('--jobs', type=int, help='exact number of jobs (overrides --scale)')
+    parser.add_argument('--days', type=int, default=730, help='history length in days (default: 730)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default=os.path.join(ROOT, 'bench', 'bench.db'),
+                        help='SQLite file to fill (ignored when DATABASE_URL is set)')
+    parser.add_argument('--force', action='store_true', help='delete an existing --db file first')
+    args = parser.parse_args(argv)
+    jobs = args.jobs or SCALES[args.scale]
+
+    if not os.environ.get('DATABASE_URL'):
+        if os.path.exists(args.db):
+            if not args.force:
+                parser.error(f"{args.db} already exists (use --force to replace it)")
+            os.remove(args.db)
+        os.environ['SQLITE_PATH'] = os.path.abspath(args.db)
+
+    sys.path.insert(0, ROOT)
+    from app import create_app, migrate_database
+    from models import db, recompute_job_balances, rebuild_daily_ledger
+    app = create_app()
+
+    started = time.perf_counter()
+    with app.app_context():
+        migrate_database()
+        if db.session.execute(db.text("SELECT 1 FROM job LIMIT 1")).first():
+            sys.exit("target database already has jobs; seed an empty database")
+        print(f"Seeding {jobs} jobs over {args.days} days into {db.engine.url}")
+        counts = generate(db.session, db.metadata.tables, jobs, args.days, args.seed)
+        if db.engine.dialect.name == 'postgresql':
+            # ids were inserted explicitly, so move the serial sequences past them
+            for table in ('customer', 'job', 'payment', 'expense'):
+                db.session.execute(db.text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT COALESCE(MAX(id), 1) FROM {table}))"))
+        recompute_job_balances()
+        db.session.commit()
+        days = rebuild_daily_ledger()
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text("ANALYZE"))
+            db.session.commit()
+            # fold the WAL back in so the seeded file can be copied on its own
+            db.session.execute(db.text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        db.session.close()
+        db.engine.dispose()
+    print(f"Done in {time.perf_counter() - started:.1f}s: {counts}, {days} ledger days")
+
+
+if __name__ == '__main__':
+    main()
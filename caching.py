@@ -0,0 +1,110 @@
+"""Conditional GETs and small in-process LRU caches.
+
+``conditional(stamp)`` wraps a GET view. ``stamp(**view_args)`` returns a cheap version of what
+the view would show plus its last write time (or None to just run the view); the ETag is a hash
+of the endpoint, the full path and that version, so a client sending a matching If-None-Match
+gets a 304 before the view queries or renders anything. With ``cache=`` an ``LRUCache`` also
+keeps the rendered body per ETag, so other clients of the same version skip the view too.
+
+Last-Modified is sent for information only: the ETag also covers things a timestamp does not
+(query arguments, "today" in default date ranges, deploys), so If-Modified-Since alone never
+produces a 304.
+"""
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+
+class LRUCache:
+    """Thread-safe dict bounded to maxsize entries, least recently used evicted first (0 disables)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+_deploy_stamp = None
+
+
+def deploy_stamp():
+    """Newest mtime of the app's modules and templates: a deploy changes what the same data renders to."""
+    global _deploy_stamp
+    if _deploy_stamp is None:
+        root = current_app.root_path
+        paths = glob.glob(os.path.join(root, '*.py')) + glob.glob(os.path.join(root, current_app.template_folder, '*.html'))
+        _deploy_stamp = max(os.path.getmtime(p) for p in paths)
+    return _deploy_stamp
+
+
+def make_etag(*parts):
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:24]
+
+
+def add_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # browsers keep the copy but revalidate it on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(stamp, cache=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            # flashed messages are rendered into the next page exactly once, so that page is never
+            # answered from a validator or the cache
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return view(**view_args)
+            stamped = stamp(**view_args)
+            if stamped is None:
+                return view(**view_args)
+            version, last_modified = stamped
+            etag = make_etag(request.endpoint, request.full_path, version)
+            if not is_resource_modified(request.environ, etag=etag):
+                return add_validators(current_app.response_class(status=304), etag, last_modified)
+            key = (request.endpoint, etag)
+            hit = cache.get(key) if cache is not None else None
+            if hit is not None:
+                body, content_type = hit
+                return add_validators(current_app.response_class(body, content_type=content_type), etag, last_modified)
+            response = make_response(view(**view_args))
+            if response.status_code != 200:
+                return response
+            if cache is not None and not response.is_streamed and not response.direct_passthrough:
+                cache.put(key, (response.get_data(), response.content_type))
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
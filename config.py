@@ -0,0 +1,115 @@
+import os
+
+from sqlalchemy import event
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_flag(name, default=False):
+    value = os.environ.get(name)
+    return value.strip().lower() in ('1', 'true', 'yes', 'on') if value not in (None, '') else default
+
+
+def database_url():
+    # DATABASE_URL (e.g. Postgres on Render) wins; otherwise a local SQLite file
+    url = os.environ.get('DATABASE_URL')
+    if url:
+        # Heroku/Render still hand out postgres://, which SQLAlchemy no longer accepts
+        if url.startswith('postgres://'):
+            url = 'postgresql://' + url[len('postgres://'):]
+        return url
+    path = os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'jyoti_electronics.db'))
+    return f"sqlite:///{path}"
+
+
+def engine_options(url):
+    # pools are per process: every gunicorn worker gets its own engine after fork
+    if url.startswith('sqlite'):
+        if ':memory:' in url or url in ('sqlite://', 'sqlite:///'):
+            return {}
+        return {
+            'pool_size': env_int('DB_POOL_SIZE', 5),
+            'max_overflow': env_int('DB_MAX_OVERFLOW', 5),
+            'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        }
+    return {
+        'pool_size': env_int('DB_POOL_SIZE', 5),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 5),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'change-me')
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # applied to every new SQLite connection (see apply_sqlite_pragmas)
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'cache_size': -env_int('SQLITE_CACHE_SIZE_KB', 20000),  # negative = KiB
+        'mmap_size': env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'temp_store': 'MEMORY',
+    }
+
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(BASE_DIR, 'uploads'))
+    IMPORT_FOLDER = os.path.join(UPLOAD_FOLDER, 'imports')  # uploaded CSV/XLSX files for bulk import
+    EXPORT_FOLDER = os.path.join(UPLOAD_FOLDER, 'exports')  # background XLSX exports
+    INVOICE_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'invoices')  # rendered invoice PDFs
+
+    # optional: path to wkhtmltopdf binary
+    # e.g. export WKHTMLTOPDF_PATH="/usr/local/bin/wkhtmltopdf"
+    WKHTMLTOPDF_PATH = os.environ.get('WKHTMLTOPDF_PATH')
+    # at most this many wkhtmltopdf processes run at once per app process
+    PDF_RENDER_WORKERS = env_int('PDF_RENDER_WORKERS', 2)
+    # XLSX exports with more rows than this are generated in the background
+    XLSX_BACKGROUND_ROWS = env_int('XLSX_BACKGROUND_ROWS', 5000)
+
+    # summary reports bucket days in this IANA zone unless ?tz= is given (UTC days use the ledger rollup)
+    REPORT_TIMEZONE = os.environ.get('REPORT_TIMEZONE', 'UTC')
+    # distinct (range, granularity, tz) results memoized per process until the next write
+    REPORT_CACHE_SIZE = env_int('REPORT_CACHE_SIZE', 128)
+    # rendered job pages/invoices kept per process, keyed by ETag (0 disables; 304s work regardless)
+    RENDER_CACHE_SIZE = env_int('RENDER_CACHE_SIZE', 256)
+
+    # `flask archive-jobs` moves jobs completed (and fully paid) longer ago than this to the archive tables
+    ARCHIVE_AFTER_DAYS = env_int('ARCHIVE_AFTER_DAYS', 365)
+
+    # live event feed at /events (see events.py): each open stream holds a gthread thread, so by
+    # default half of GUNICORN_THREADS per worker; raise it with GUNICORN_WORKER_CLASS=gevent
+    EVENTS_MAX_STREAMS = env_int('EVENTS_MAX_STREAMS', max(1, env_int('GUNICORN_THREADS', 4) // 2))
+    EVENTS_POLL_MS = env_int('EVENTS_POLL_MS', 1000)
+    # streams end after this long and the browser reconnects, freeing the thread in between
+    EVENTS_STREAM_SECONDS = env_int('EVENTS_STREAM_SECONDS', 300)
+    EVENTS_RETENTION_HOURS = env_int('EVENTS_RETENTION_HOURS', 24)
+
+    # request/SQL instrumentation and /metrics (see instrumentation.py); off by default
+    METRICS_ENABLED = env_flag('METRICS_ENABLED')
+    SLOW_REQUEST_MS = env_int('SLOW_REQUEST_MS', 500)
+    # the same SQL statement this many times in one request is reported as a likely N+1
+    N_PLUS_ONE_THRESHOLD = env_int('N_PLUS_ONE_THRESHOLD', 10)
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    # only the app's own engine, once per engine (create_app calls this right after db.init_app)
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
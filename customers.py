@@ -0,0 +1,127 @@
+"""Customer routes: the customer directory (autocomplete), history pages and merging duplicates."""
+import click
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
+from sqlalchemy import func, select, union_all
+
+from jobs import (binary_collated, decode_job_cursor, jobs_listing_query, page_size_arg, phone_match, phone_search_key,
+                  seek_jobs, text_match)
+from models import Customer, Job, JobArchive, bump_data_version, commit_unit, db, find_or_create_customer
+
+bp = Blueprint('customers', __name__, cli_group=None)
+
+CUSTOMER_AUTOCOMPLETE_LIMIT = 10
+ARCHIVED_HISTORY_LIMIT = 200
+
+def merge_customers(keep_id, merge_ids):
+    """Move every job of merge_ids onto keep_id and delete those customers; returns the jobs moved.
+
+    The kept customer inherits a phone/address it lacks from the merged ones. Caller commits.
+    """
+    merge_ids = sorted(set(merge_ids) - {keep_id})
+    keep = db.session.get(Customer, keep_id)
+    others = Customer.query.filter(Customer.id.in_(merge_ids)).order_by(Customer.id.desc()).all() if merge_ids else []
+    if keep is None or len(others) != len(merge_ids):
+        missing = {keep_id} if keep is None else set(merge_ids) - {o.id for o in others}
+        raise ValueError(f"Unknown customer id(s): {', '.join(map(str, sorted(missing)))}")
+    phone = next((o.phone for o in others if o.phone), None)
+    address = next((o.address for o in others if o.address), None)
+    moved = sum(db.session.execute(t.update().where(t.c.customer_id.in_(merge_ids)).values(customer_id=keep_id)).rowcount
+                for t in (Job.__table__, JobArchive.__table__))
+    # Core delete: the ORM cascade would otherwise load (and delete) the jobs just moved
+    db.session.execute(Customer.__table__.delete().where(Customer.id.in_(merge_ids)))
+    for o in others:
+        db.session.expunge(o)
+    db.session.expire(keep, ['jobs'])
+    if phone and not keep.phone:
+        keep.phone = phone
+    if address and not keep.address:
+        keep.address = address
+    bump_data_version(db.session.connection())
+    return moved
+
+@bp.cli.command('merge-customers')
+@click.argument('keep_id', type=int)
+@click.argument('merge_ids', type=int, nargs=-1, required=True)
+def merge_customers_command(keep_id, merge_ids):
+    """Merge duplicate customers MERGE_IDS into KEEP_ID, moving their jobs."""
+    try:
+        moved = merge_customers(keep_id, merge_ids)
+    except ValueError as exc:
+        raise click.ClickException(str(exc))
+    db.session.commit()
+    click.echo(f"Merged {len(set(merge_ids) - {keep_id})} customer(s) into {keep_id}, moved {moved} job(s).")
+
+@bp.route('/customer/new', methods=['POST'])
+def new_customer():
+    name = request.form.get('name')
+    if not name:
+        flash('Name required', 'danger')
+        return redirect(url_for('jobs.index'))
+    c, created = commit_unit(lambda: find_or_create_customer(name, request.form.get('phone'), request.form.get('address')))
+    if not created:
+        flash(f'A customer with this phone already exists: {c.name}', 'danger')
+        return redirect(url_for('customers.customer_detail', customer_id=c.id))
+    flash('Customer created', 'success')
+    return redirect(url_for('jobs.index'))
+
+@bp.route('/api/customers/autocomplete')
+def customers_autocomplete():
+    # prefix match on the phone number (unique phone_normalized index) or the name (lower(name) index)
+    term = (request.args.get('q') or '').strip()
+    if len(term) < 2:
+        return jsonify({'results': []})
+    key = phone_search_key(term)
+    if key:
+        cond, order = phone_match(key), binary_collated(Customer.phone_normalized)
+    else:
+        cond, order = text_match(Customer.name, term, 'prefix'), binary_collated(func.lower(Customer.name))
+    customers = (db.session.query(Customer.id, Customer.name, Customer.phone, Customer.address)
+                 .filter(cond).order_by(order, Customer.id).limit(CUSTOMER_AUTOCOMPLETE_LIMIT).all())
+    stats = {}
+    if customers:
+        stats = {cid: (n, last) for cid, n, last in
+                 db.session.query(Job.customer_id, func.count(Job.id), func.max(Job.created_at))
+                 .filter(Job.customer_id.in_([c.id for c in customers])).group_by(Job.customer_id)}
+    return jsonify({'results': [
+        {'id': c.id, 'name': c.name, 'phone': c.phone, 'address': c.address,
+         'jobs': stats.get(c.id, (0, None))[0],
+         'last_visit': stats[c.id][1].strftime('%Y-%m-%d') if c.id in stats and stats[c.id][1] else None}
+        for c in customers]})
+
+@bp.route('/customer/<int:customer_id>')
+def customer_detail(customer_id):
+    c = Customer.query.get_or_404(customer_id)
+    per_page = page_size_arg()
+    cursor = request.args.get('cursor')
+    # both served by ix_job_customer_created (and its archive twin)
+    jobs_sq = union_all(*(select(m.id, m.amount_charged, m.paid_total, m.balance_due, m.created_at)
+                          .where(m.customer_id == c.id) for m in (Job, JobArchive))).subquery()
+    stats = db.session.execute(select(func.count(jobs_sq.c.id), func.sum(jobs_sq.c.amount_charged), func.sum(jobs_sq.c.paid_total),
+                                      func.sum(jobs_sq.c.balance_due), func.min(jobs_sq.c.created_at),
+                                      func.max(jobs_sq.c.created_at))).one()
+    rows, next_cursor = seek_jobs(jobs_listing_query().filter(Job.customer_id == c.id), decode_job_cursor(cursor), per_page)
+    # archived works are long finished; listed after the last page of the hot ones
+    archived = [] if next_cursor else (JobArchive.query.filter_by(customer_id=c.id)
+                                       .order_by(JobArchive.created_at.desc(), JobArchive.id.desc())
+                                       .limit(ARCHIVED_HISTORY_LIMIT).all())
+    # same name, other record: likely the same person entered without (or with another) phone
+    duplicates = (Customer.query.filter(func.lower(Customer.name) == (c.name or '').lower(), Customer.id != c.id)
+                  .order_by(Customer.id).limit(20).all())
+    return render_template('customer.html', customer=c, stats=stats, rows=rows, next_cursor=next_cursor,
+                           is_first_page=not cursor, page_args={'customer_id': c.id, 'per_page': per_page},
+                           duplicates=duplicates, archived=archived)
+
+@bp.route('/customer/<int:customer_id>/merge', methods=['POST'])
+def merge_customer(customer_id):
+    merge_ids = [int(x) for x in request.form.getlist('merge_ids') if x.isdigit()]
+    if not merge_ids:
+        flash('Select the duplicate customers to merge', 'danger')
+        return redirect(url_for('customers.customer_detail', customer_id=customer_id))
+    try:
+        moved = merge_customers(customer_id, merge_ids)
+    except ValueError as exc:
+        flash(str(exc), 'danger')
+        return redirect(url_for('customers.customer_detail', customer_id=customer_id))
+    db.session.commit()
+    flash(f'Merged {len(merge_ids)} customer(s), moved {moved} job(s)', 'success')
+    return redirect(url_for('customers.customer_detail', customer_id=customer_id))
@@ -0,0 +1,191 @@
+"""Live event feed: outbox rows fanned out to Server-Sent Events streams.
+
+Writes add rows to the ``event_outbox`` table in the same transaction as the change (see
+models.py), so every gunicorn worker sees every event. Each worker runs a single poller thread
+that reads new outbox rows, one primary-key range query per poll no matter how many screens
+are connected, and wakes its streams. A commit in the same worker wakes the poller at once.
+
+Every stream holds a worker thread (gthread) or greenlet (gevent) while it is open. Streams
+therefore end after ``stream_seconds`` and clients reconnect with Last-Event-ID. Past
+``max_streams`` a client is told to retry later instead of being served.
+
+The ``/events`` route at the bottom serves the front-desk screens, which follow it instead of
+reloading /jobs; each app gets its own hub (``app.extensions['event_hub']``).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from flask import Blueprint, Response, current_app, request
+from sqlalchemy import event, func, select
+
+from models import EventOutbox, db
+
+log = logging.getLogger(__name__)
+
+
+def format_event(event_id, kind, data):
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class EventHub:
+    def __init__(self, fetch_after, latest_id, poll_seconds=1.0, max_streams=2,
+                 stream_seconds=300, heartbeat_seconds=15, buffer=1000):
+        self.fetch_after = fetch_after  # fetch_after(last_id) -> [(id, kind, data)] in id order
+        self.latest_id = latest_id      # latest_id() -> highest id in the outbox (0 if empty)
+        self.poll_seconds = poll_seconds
+        self.max_streams = max_streams
+        self.stream_seconds = stream_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.recent = deque(maxlen=buffer)
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.last_id = 0
+        self.streams = 0
+        self.pid = None
+
+    def poke(self):
+        # something was committed in this process; poll now instead of at the next tick
+        self.wake.set()
+
+    def _start(self):
+        # called under cond; one poller per process, started on first use (never in the
+        # gunicorn master, never for CLI commands), and again after a fork
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.recent.clear()
+        threading.Thread(target=self._poll, name='event-poller', daemon=True).start()
+
+    def _poll(self):
+        while True:
+            self.wake.wait(self.poll_seconds)
+            self.wake.clear()
+            if not self.streams:
+                continue
+            try:
+                rows = self.fetch_after(self.last_id)
+            except Exception:
+                log.exception("Polling the event outbox failed")
+                continue
+            if rows:
+                with self.cond:
+                    self.recent.extend(rows)
+                    self.last_id = rows[-1][0]
+                    self.cond.notify_all()
+
+    def open(self):
+        """Reserve a stream slot; returns the id a new client starts after, or None when full."""
+        idle = False
+        with self.cond:
+            if self.streams >= self.max_streams:
+                return None
+            self._start()
+            self.streams += 1
+            idle = self.streams == 1
+        if idle:
+            # nobody was listening, so the poller is behind; skip what nobody was waiting for
+            try:
+                latest = self.latest_id()
+            except Exception:
+                self.close()
+                raise
+            with self.cond:
+                self.last_id = max(self.last_id, latest)
+        return self.last_id
+
+    def close(self):
+        with self.cond:
+            self.streams -= 1
+
+    def stream(self, cursor, backlog=()):
+        """SSE text for events after cursor: backlog (replayed from the outbox) first, then live ones.
+
+        The caller reserves the slot with open() and releases it with close() once the response
+        is closed (a generator that never started would not run a finally block).
+        """
+        yield "retry: 3000\n\n"
+        for event_id, kind, data in backlog:
+            yield format_event(event_id, kind, data)
+            cursor = event_id
+        deadline = time.monotonic() + self.stream_seconds
+        while time.monotonic() < deadline:
+            with self.cond:
+                events = [e for e in self.recent if e[0] > cursor]
+                if not events:
+                    self.cond.wait(min(self.heartbeat_seconds, max(deadline - time.monotonic(), 0)))
+                    events = [e for e in self.recent if e[0] > cursor]
+            if not events:
+                yield ": keepalive\n\n"  # also how a dropped client is noticed
+                continue
+            for event_id, kind, data in events:
+                yield format_event(event_id, kind, data)
+            cursor = events[-1][0]
+
+
+bp = Blueprint('events', __name__)
+
+EVENTS_REPLAY_LIMIT = 500
+
+
+def outbox_after(last_id, limit=EVENTS_REPLAY_LIMIT):
+    rows = db.session.execute(select(EventOutbox.id, EventOutbox.kind, EventOutbox.data)
+                              .where(EventOutbox.id > last_id).order_by(EventOutbox.id).limit(limit))
+    return [(r.id, r.kind, json.loads(r.data)) for r in rows]
+
+
+@bp.record_once
+def _init_hub(state):
+    app = state.app
+
+    def fetch_after(last_id):
+        # runs on the poller thread, outside any request
+        with app.app_context():
+            return outbox_after(last_id)
+
+    def latest_id():
+        with app.app_context():
+            return db.session.execute(select(func.max(EventOutbox.id))).scalar() or 0
+
+    app.extensions['event_hub'] = EventHub(fetch_after, latest_id,
+                                           poll_seconds=app.config['EVENTS_POLL_MS'] / 1000.0,
+                                           max_streams=app.config['EVENTS_MAX_STREAMS'],
+                                           stream_seconds=app.config['EVENTS_STREAM_SECONDS'])
+
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_event_streams(session):
+    # set by models._write_outbox when the flush wrote outbox rows
+    if session.info.pop('events_written', False):
+        current_app.extensions['event_hub'].poke()
+
+
+@bp.route('/events')
+def events_stream():
+    """job_created, payment_added, job_completed and expense_added as Server-Sent Events.
+
+    Reconnecting clients send Last-Event-ID (or ?since=ID) and get what they missed from the outbox.
+    """
+    hub = current_app.extensions['event_hub']
+    cursor = hub.open()
+    if cursor is None:
+        # this worker's stream slots are all taken; EventSource reconnects after `retry` ms
+        return Response("retry: 15000\n\n", mimetype='text/event-stream')
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since') or ''
+        backlog = []
+        if since.isdigit():
+            cursor = int(since)
+            backlog = outbox_after(cursor)
+        # the stream itself never touches the database; give the connection back to the pool
+        db.session.close()
+    except Exception:
+        hub.close()
+        raise
+    response = Response(hub.stream(cursor, backlog), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(hub.close)
+    return response
@@ -0,0 +1,81 @@
+"""Expense routes: the daily expenses list (with its old aliases), adding and deleting expenses."""
+from datetime import datetime
+
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
+
+from models import Expense, db
+
+bp = Blueprint('expenses', __name__)
+
+@bp.route('/expenses')
+@bp.route('/expenses/')
+@bp.route('/daily_expenses')
+@bp.route('/daily_expenses/')
+def expenses_list():
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+
+        q = Expense.query
+
+        if start:
+            try:
+                s = datetime.strptime(start, "%Y-%m-%d").date()
+                q = q.filter(Expense.date >= s)
+            except Exception:
+                current_app.logger.warning("Invalid start date filter: %s", start)
+
+        if end:
+            try:
+                e = datetime.strptime(end, "%Y-%m-%d").date()
+                q = q.filter(Expense.date <= e)
+            except Exception:
+                current_app.logger.warning("Invalid end date filter: %s", end)
+
+        items = q.order_by(Expense.date.desc(), Expense.created_at.desc()).all()
+
+        # compute total on server side
+        total_amount = sum((float(it.amount) if it.amount is not None else 0.0) for it in items)
+
+        return render_template('expenses.html', expenses=items, total_amount=total_amount)
+
+    except Exception as exc:
+        current_app.logger.exception("Error rendering expenses_list")
+        return f"Server error while loading expenses page: {exc}", 500
+
+
+@bp.route('/expenses/new', methods=['GET', 'POST'])
+def new_expense():
+    if request.method == 'POST':
+        desc = request.form.get('description')
+        try:
+            amt = float(request.form.get('amount') or 0)
+        except Exception:
+            flash('Invalid amount', 'danger')
+            return redirect(url_for('expenses.expenses_list'))
+        d = request.form.get('date')
+        try:
+            date_parsed = datetime.strptime(d, "%Y-%m-%d").date() if d else datetime.utcnow().date()
+        except Exception:
+            date_parsed = datetime.utcnow().date()
+
+        if amt <= 0:
+            flash("Amount must be positive", "danger")
+            return redirect(url_for('expenses.expenses_list'))
+
+        e = Expense(description=desc, amount=amt, date=date_parsed)
+        db.session.add(e)
+        db.session.commit()
+        flash("Expense added", "success")
+        return redirect(url_for('expenses.expenses_list'))
+
+    # GET
+    return render_template("new_expense.html")
+
+@bp.route('/expenses/<int:expense_id>/delete', methods=['POST'])
+def delete_expense(expense_id):
+    e = Expense.query.get_or_404(expense_id)
+    db.session.delete(e)
+    db.session.commit()
+    flash("Expense deleted", "success")
+    return redirect(url_for('expenses.expenses_list'))
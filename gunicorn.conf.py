@@ -0,0 +1,21 @@
+# picked up automatically by `gunicorn 'app:create_app()'` (see Procfile)
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# threaded workers: each worker holds its own DB pool sized by DB_POOL_SIZE
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# GUNICORN_WORKER_CLASS=gevent (pip install gevent) for many /events screens per worker
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or ('gthread' if threads > 1 else 'sync')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+
+def post_fork(server, worker):
+    # with preload_app the master built the app and may already have opened connections; never share
+    # them across processes (without it each worker calls create_app() itself and there is nothing to do)
+    if not server.cfg.preload_app:
+        return
+    from models import db
+    with server.app.wsgi().app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,417 @@
+"""Bulk import of jobs, payments or expenses from CSV/XLSX files: the /import page and `flask import-records`.
+
+Jobs use the export_jobs_csv columns (plus an optional Paid column); payments and expenses files are
+recognised by their headers.
+"""
+import csv
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, date
+from types import SimpleNamespace
+
+import click
+from flask import Blueprint, abort, current_app, flash, redirect, render_template, request, url_for
+from sqlalchemy import func, select, text
+
+from models import (Customer, Expense, ImportCheckpoint, Job, JobArchive, Payment, bump_data_version, db,
+                    expense_contribution, job_balance_apply_many, job_contribution, ledger_apply_many,
+                    normalize_phone, payment_contribution)
+from reports import read_status_file, submit_background, touch_background_statuses, write_status_file
+
+bp = Blueprint('importer', __name__, cli_group=None)
+
+IMPORT_BATCH_SIZE = 2000
+IMPORT_KINDS = {
+    'jobs': {'Customer', 'Charge'},
+    'payments': {'JobID', 'Amount'},
+    'expenses': {'Description', 'Amount'},
+}
+IMPORT_MAX_REPORTED_ERRORS = 500
+
+class ImportRowError(ValueError):
+    pass
+
+def import_kind(headers):
+    headers = set(headers)
+    for kind, required in IMPORT_KINDS.items():
+        if required <= headers:
+            return kind
+    raise ImportRowError(f"Unrecognised columns: {', '.join(sorted(headers))}")
+
+def read_import_rows(path):
+    # yields the header list, then (row number in the file, dict) per non-blank data row; the header is row 1
+    if path.lower().endswith('.xlsx'):
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            headers = [str(h or '').strip() for h in next(rows, ())]
+            yield headers
+            for n, values in enumerate(rows, start=2):
+                if any(v not in (None, '') for v in values):
+                    yield n, dict(zip(headers, values))
+        finally:
+            wb.close()
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            headers = [h.strip() for h in next(reader, [])]
+            yield headers
+            line = reader.line_num
+            for values in reader:
+                if any(v.strip() for v in values):
+                    yield line + 1, dict(zip(headers, values))  # the record's first line; quoted fields can span lines
+                line = reader.line_num
+
+def _text(row, key):
+    v = row.get(key)
+    v = v.strip() if isinstance(v, str) else v
+    return None if v in (None, '') else str(v)
+
+def _amount(row, key):
+    v = row.get(key)
+    if v in (None, ''):
+        return 0.0
+    try:
+        return float(str(v).replace(',', '').replace('₹', '').strip())
+    except ValueError:
+        raise ImportRowError(f"{key}: not a number ({v!r})")
+
+def _timestamp(row, key):
+    v = row.get(key)
+    if v in (None, ''):
+        return None
+    if isinstance(v, datetime):
+        return v
+    if isinstance(v, date):
+        return datetime.combine(v, datetime.min.time())
+    try:
+        return datetime.fromisoformat(str(v).strip())  # export format, fast path
+    except ValueError:
+        pass
+    for fmt in ('%d-%m-%Y', '%d/%m/%Y', '%d-%m-%Y %H:%M', '%d/%m/%Y %H:%M'):
+        try:
+            return datetime.strptime(str(v).strip(), fmt)
+        except ValueError:
+            pass
+    raise ImportRowError(f"{key}: unrecognised date ({v!r})")
+
+def _job_id(row):
+    v = _text(row, 'JobID')
+    if v is None:
+        return None
+    try:
+        return int(float(v))
+    except ValueError:
+        raise ImportRowError(f"JobID: not a number ({v!r})")
+
+def insert_returning_ids(conn, table, rows):
+    # executemany INSERT returning the new ids in parameter order
+    if not rows:
+        return []
+    if conn.dialect.name == 'sqlite':
+        # SQLite can only return ordered ids one row per statement; the batch transaction already
+        # holds the write lock, so ids past MAX(id) and the AUTOINCREMENT counter (which also
+        # covers deleted and archived ids) are ours to assign
+        high = conn.execute(select(func.coalesce(func.max(table.c.id), 0))).scalar()
+        seq = conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = :name"), {'name': table.name}).scalar()
+        first = max(high, seq or 0) + 1
+        ids = list(range(first, first + len(rows)))
+        conn.execute(table.insert(), [dict(r, id=i) for r, i in zip(rows, ids)])
+        return ids
+    stmt = table.insert().returning(table.c.id, sort_by_parameter_order=True)
+    return list(conn.execute(stmt, rows).scalars())
+
+class BulkImporter:
+    # one instance per import; conn is swapped for each batch transaction
+    def __init__(self):
+        self.conn = None
+        self.customers = None
+
+    def customer_ids(self):
+        # normalized phone -> customer id, loaded once per import
+        if self.customers is None:
+            self.customers = {}
+            for cid, key in self.conn.execute(select(Customer.id, Customer.phone_normalized)
+                                              .where(Customer.phone_normalized != None)):
+                self.customers[key] = cid
+        return self.customers
+
+    def import_jobs(self, rows):
+        parsed, errors = [], []
+        for n, row in rows:
+            try:
+                name = _text(row, 'Customer')
+                if not name:
+                    raise ImportRowError("Customer: required")
+                created_at = _timestamp(row, 'Date') or datetime.utcnow()
+                completed_at = _timestamp(row, 'CompletedAt')
+                charge = _amount(row, 'Charge')
+                job = dict(id=_job_id(row), area=_text(row, 'Area'), tv_model=_text(row, 'TVModel'),
+                           repair_work=_text(row, 'RepairWork'), amount_charged=charge, expense=_amount(row, 'Expense'),
+                           payment_mode=_text(row, 'PaymentMode'), note=_text(row, 'Note'),
+                           status=_text(row, 'Status') or ('completed' if completed_at else 'received'),
+                           pickup_date=_text(row, 'Pickup'), created_at=created_at, completed_at=completed_at,
+                           paid_total=0.0, balance_due=charge)
+                phone = _text(row, 'Phone')
+                customer = dict(name=name, phone=phone, phone_normalized=normalize_phone(phone),
+                                address=_text(row, 'Address'), created_at=created_at)
+                parsed.append((n, customer, job, _amount(row, 'Paid')))
+            except ImportRowError as exc:
+                errors.append((n, str(exc)))
+
+        # explicit JobIDs keep their id; ones already present are reported rather than overwritten
+        wanted = [job['id'] for _, _, job, _ in parsed if job['id'] is not None]
+        taken = set()
+        if wanted:
+            for model in (Job, JobArchive):
+                taken.update(self.conn.execute(select(model.id).where(model.id.in_(wanted))).scalars())
+        seen, keep = set(), []
+        for n, customer, job, paid in parsed:
+            if job['id'] is not None and (job['id'] in taken or job['id'] in seen):
+                errors.append((n, f"JobID {job['id']} already exists"))
+                continue
+            seen.add(job['id'])
+            keep.append((n, customer, job, paid))
+
+        # customers deduped by normalized phone (existing rows and earlier rows of this file)
+        known = self.customer_ids()
+        new_customers, pending = [], {}
+        for _, customer, job, _ in keep:
+            key = customer['phone_normalized']
+            if key and key in known:
+                job['customer_id'] = known[key]
+            elif key and key in pending:
+                pending[key].append(job)
+            else:
+                new_customers.append(customer)
+                pending[key or object()] = [job]
+        for cid, jobs_for_customer, customer in zip(insert_returning_ids(self.conn, Customer.__table__, new_customers),
+                                                    pending.values(), new_customers):
+            for job in jobs_for_customer:
+                job['customer_id'] = cid
+            if customer['phone_normalized']:
+                known[customer['phone_normalized']] = cid
+
+        # executemany needs uniform keys: rows with and without an explicit id go separately
+        with_id = [job for _, _, job, _ in keep if job['id'] is not None]
+        without_id = [{k: v for k, v in job.items() if k != 'id'} for _, _, job, _ in keep if job['id'] is None]
+        if with_id:
+            self.conn.execute(Job.__table__.insert(), with_id)
+            if self.conn.dialect.name == 'postgresql':
+                # only ever forward: ids below the sequence may belong to deleted or archived jobs
+                self.conn.execute(text("SELECT setval(pg_get_serial_sequence('job', 'id'), "
+                                       "GREATEST(nextval(pg_get_serial_sequence('job', 'id')), :next), false)"),
+                                  {'next': max(job['id'] for job in with_id) + 1})
+        for job, new_id in zip(without_id, insert_returning_ids(self.conn, Job.__table__, without_id)):
+            job['id'] = new_id
+        ids = iter(j['id'] for j in without_id)
+        for _, _, job, _ in keep:
+            if job['id'] is None:
+                job['id'] = next(ids)
+
+        payments = [dict(job_id=job['id'], amount=paid, payment_mode=job['payment_mode'], note='imported',
+                         payment_date=job['completed_at'] or job['created_at'])
+                    for _, _, job, paid in keep if paid > 0]
+        self.insert_payments(payments)
+        ledger_apply_many(self.conn, [job_contribution(SimpleNamespace(**job)) for _, _, job, _ in keep])
+        return len(keep), errors
+
+    def insert_payments(self, payments):
+        if not payments:
+            return
+        self.conn.execute(Payment.__table__.insert(), payments)
+        per_job = {}
+        for p in payments:
+            per_job[p['job_id']] = per_job.get(p['job_id'], 0.0) + p['amount']
+        job_balance_apply_many(self.conn, per_job)
+        ledger_apply_many(self.conn, [payment_contribution(SimpleNamespace(**p)) for p in payments])
+
+    def import_payments(self, rows):
+        parsed, errors = [], []
+        for n, row in rows:
+            try:
+                job_id = _job_id(row)
+                if job_id is None:
+                    raise ImportRowError("JobID: required")
+                amount = _amount(row, 'Amount')
+                if amount <= 0:
+                    raise ImportRowError("Amount: must be positive")
+                parsed.append((n, dict(job_id=job_id, amount=amount, payment_mode=_text(row, 'PaymentMode'),
+                                       note=_text(row, 'Note'), payment_date=_timestamp(row, 'Date') or datetime.utcnow())))
+            except ImportRowError as exc:
+                errors.append((n, str(exc)))
+        wanted = {p['job_id'] for _, p in parsed}
+        existing = set(self.conn.execute(select(Job.id).where(Job.id.in_(wanted))).scalars()) if wanted else set()
+        payments = []
+        for n, p in parsed:
+            if p['job_id'] in existing:
+                payments.append(p)
+            else:
+                errors.append((n, f"JobID {p['job_id']} not found"))
+        self.insert_payments(payments)
+        return len(payments), errors
+
+    def import_expenses(self, rows):
+        expenses, errors = [], []
+        for n, row in rows:
+            try:
+                amount = _amount(row, 'Amount')
+                if amount <= 0:
+                    raise ImportRowError("Amount: must be positive")
+                when = _timestamp(row, 'Date')
+                expenses.append(dict(description=_text(row, 'Description'), amount=amount,
+                                     date=when.date() if when else date.today(), created_at=when or datetime.utcnow()))
+            except ImportRowError as exc:
+                errors.append((n, str(exc)))
+        if expenses:
+            self.conn.execute(Expense.__table__.insert(), expenses)
+            ledger_apply_many(self.conn, [expense_contribution(SimpleNamespace(**e)) for e in expenses])
+        return len(expenses), errors
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def import_records(path, filename=None, batch_size=IMPORT_BATCH_SIZE, heartbeat=None):
+    """Import a CSV/XLSX file in batched transactions; re-running the same file resumes after the last committed batch.
+
+    heartbeat, if given, is called after every batch.
+    """
+    filename = filename or os.path.basename(path)
+    file_hash = file_sha256(path)
+    report = {'filename': filename, 'kind': None, 'inserted': 0, 'errors': [], 'error_count': 0,
+              'resumed_from': 0, 'already_imported': False}
+    checkpoint = db.session.get(ImportCheckpoint, file_hash)
+    if checkpoint and checkpoint.finished_at:
+        report.update(kind=checkpoint.kind, already_imported=True)
+        return report
+
+    rows = read_import_rows(path)
+    headers = next(rows, [])
+    kind = import_kind(headers)
+    report['kind'] = kind
+    skip = checkpoint.rows_done if checkpoint else 0  # counted in non-blank data rows
+    if checkpoint is None:
+        db.session.add(ImportCheckpoint(file_hash=file_hash, filename=filename, kind=kind))
+        db.session.commit()
+
+    importer = BulkImporter()
+
+    def run_batch(batch, rows_done):
+        # one transaction per batch: inserts, ledger/balance deltas and the checkpoint commit together
+        # (the checkpoint write goes first so the transaction takes the write lock up front)
+        with db.engine.begin() as conn:
+            conn.execute(ImportCheckpoint.__table__.update()
+                         .where(ImportCheckpoint.__table__.c.file_hash == file_hash)
+                         .values(rows_done=rows_done, updated_at=datetime.utcnow()))
+            importer.conn = conn
+            inserted, errors = getattr(importer, f"import_{kind}")(batch)
+            if inserted:
+                bump_data_version(conn)
+        errors.sort()
+        report['inserted'] += inserted
+        report['error_count'] += len(errors)
+        room = IMPORT_MAX_REPORTED_ERRORS - len(report['errors'])
+        report['errors'].extend(errors[:max(room, 0)])
+        if heartbeat is not None:
+            heartbeat()
+
+    batch, rows_done = [], skip
+    for i, (n, row) in enumerate(rows):
+        if i < skip:
+            report['resumed_from'] = n
+            continue
+        batch.append((n, row))
+        if len(batch) >= batch_size:
+            rows_done += len(batch)
+            run_batch(batch, rows_done)
+            batch = []
+    if batch:
+        rows_done += len(batch)
+        run_batch(batch, rows_done)
+
+    db.session.execute(ImportCheckpoint.__table__.update()
+                       .where(ImportCheckpoint.__table__.c.file_hash == file_hash)
+                       .values(finished_at=datetime.utcnow()))
+    db.session.commit()
+    return report
+
+@bp.cli.command('import-records')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+def import_records_command(path, batch_size):
+    """Bulk import jobs, payments or expenses from a CSV/XLSX file."""
+    try:
+        report = import_records(path, batch_size=batch_size)
+    except ImportRowError as exc:
+        raise click.ClickException(str(exc))
+    if report['already_imported']:
+        click.echo(f"{report['filename']} was already imported.")
+        return
+    for n, msg in report['errors']:
+        click.echo(f"row {n}: {msg}", err=True)
+    resumed = f", resumed after row {report['resumed_from']}" if report['resumed_from'] else ''
+    click.echo(f"Imported {report['inserted']} {report['kind']} row(s) from {report['filename']}"
+               f" ({report['error_count']} error(s){resumed}).")
+
+# web uploads import on the background thread the XLSX exports use, so a large file cannot outlive the
+# gunicorn timeout; /import/<file hash> shows the status, which is kept next to the upload
+def import_status_path(file_hash):
+    if not re.fullmatch(r'[0-9a-f]{64}', file_hash):
+        abort(404)
+    return os.path.join(current_app.config['IMPORT_FOLDER'], f"{file_hash}.json")
+
+def read_import_status(file_hash):
+    return read_status_file(import_status_path(file_hash),
+                            'the import was interrupted (the server restarted); upload the file again to resume it')
+
+def run_background_import(app, file_hash, path, filename):
+    with app.app_context():
+        status_path = import_status_path(file_hash)
+        write_status_file(status_path, state='running', filename=filename)
+        try:
+            report = import_records(path, filename=filename, heartbeat=touch_background_statuses)
+            write_status_file(status_path, state='done', filename=filename, report=report)
+        except ImportRowError as exc:
+            write_status_file(status_path, state='failed', filename=filename, error=str(exc))
+        except Exception as exc:
+            current_app.logger.exception("Background import of %s failed", filename)
+            write_status_file(status_path, state='failed', filename=filename, error=str(exc))
+
+@bp.route('/import', methods=['GET', 'POST'])
+def import_upload():
+    if request.method == 'GET':
+        return render_template('import.html', status=None, report=None)
+    f = request.files.get('file')
+    if not f or not f.filename:
+        flash('Choose a CSV or XLSX file', 'danger')
+        return redirect(url_for('importer.import_upload'))
+    ext = os.path.splitext(f.filename)[1].lower()
+    if ext not in ('.csv', '.xlsx'):
+        flash('Only .csv and .xlsx files can be imported', 'danger')
+        return redirect(url_for('importer.import_upload'))
+    # stored under its content hash, so re-uploading the same file resumes the same import
+    folder = current_app.config['IMPORT_FOLDER']
+    tmp = os.path.join(folder, f"{uuid.uuid4().hex}.part")
+    f.save(tmp)
+    file_hash = file_sha256(tmp)
+    path = os.path.join(folder, f"{file_hash}{ext}")
+    os.replace(tmp, path)
+    # a file that is still importing is not queued twice; uploading it again just shows its progress
+    status_path = import_status_path(file_hash)
+    if not os.path.exists(status_path) or read_import_status(file_hash)['state'] not in ('pending', 'running'):
+        write_status_file(status_path, state='pending', filename=f.filename)
+        submit_background(status_path, run_background_import, current_app._get_current_object(),
+                          file_hash, path, f.filename)
+    return redirect(url_for('importer.import_status', file_hash=file_hash))
+
+@bp.route('/import/<file_hash>')
+def import_status(file_hash):
+    status = read_import_status(file_hash)
+    return render_template('import.html', status=status, report=status.get('report'))
@@ -0,0 +1,176 @@
+"""Opt-in request/SQL instrumentation (METRICS_ENABLED=1).
+
+Per route: request latency histogram, SQL statement count and time, and a counter of
+requests that ran the same statement N_PLUS_ONE_THRESHOLD+ times (the usual sign of a
+lazy load inside a loop). Requests slower than SLOW_REQUEST_MS are logged with their
+query stats. Everything is exposed at /metrics in the Prometheus text format.
+
+Metrics live in process memory, so with several gunicorn workers each scrape sees the
+worker that answered it; scrape per worker or keep WEB_CONCURRENCY=1 while profiling.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# seconds; the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))       # (endpoint, method)
+        self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))   # endpoint
+        self.requests = Counter()       # (endpoint, method, status)
+        self.sql_seconds = Counter()    # endpoint
+        self.n_plus_one = Counter()     # endpoint
+        self.slow = Counter()           # endpoint
+
+    def record(self, endpoint, method, status, seconds, stats, repeated, slow):
+        with self.lock:
+            self.latency[(endpoint, method)].observe(seconds)
+            self.queries[endpoint].observe(stats.count)
+            self.requests[(endpoint, method, status)] += 1
+            self.sql_seconds[endpoint] += stats.seconds
+            if repeated:
+                self.n_plus_one[endpoint] += 1
+            if slow:
+                self.slow[endpoint] += 1
+
+    def render(self):
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, h in sorted(series.items()):
+                for bound, n in zip(h.buckets, h.counts):
+                    lines.append(f'{name}_bucket{{{key},le="{bound}"}} {n}')
+                lines.append(f'{name}_bucket{{{key},le="+Inf"}} {h.count}')
+                lines.append(f"{name}_sum{{{key}}} {h.total}")
+                lines.append(f"{name}_count{{{key}}} {h.count}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{{{key}}} {value}")
+
+        with self.lock:
+            histogram('http_request_duration_seconds', 'Request latency by route.',
+                      {labels(endpoint=e, method=m): h for (e, m), h in self.latency.items()})
+            counter('http_requests_total', 'Requests by route and status.',
+                    {labels(endpoint=e, method=m, status=s): n for (e, m, s), n in self.requests.items()})
+            histogram('db_queries_per_request', 'SQL statements executed per request.',
+                      {labels(endpoint=e): h for e, h in self.queries.items()})
+            counter('db_query_seconds_total', 'Time spent executing SQL, by route.',
+                    {labels(endpoint=e): v for e, v in self.sql_seconds.items()})
+            counter('db_n_plus_one_requests_total', 'Requests that repeated one SQL statement N_PLUS_ONE_THRESHOLD+ times.',
+                    {labels(endpoint=e): v for e, v in self.n_plus_one.items()})
+            counter('http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.',
+                    {labels(endpoint=e): v for e, v in self.slow.items()})
+        return "\n".join(lines) + "\n"
+
+
+def labels(**values):
+    return ",".join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"')) for k, v in values.items())
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+
+def current_stats():
+    return g.get('_query_stats') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    starts = conn.info.get('_query_start')
+    if stats is None or not starts:
+        return
+    stats.count += 1
+    stats.seconds += time.perf_counter() - starts.pop()
+    stats.statements[statement] += 1
+
+
+def init_app(app):
+    """Register the hooks and /metrics when METRICS_ENABLED is set; no-op otherwise."""
+    if not app.config.get('METRICS_ENABLED'):
+        return None
+    metrics = Metrics()
+    slow_seconds = app.config['SLOW_REQUEST_MS'] / 1000.0
+    n_plus_one = app.config['N_PLUS_ONE_THRESHOLD']
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+        g._query_stats = QueryStats()
+
+    @app.after_request
+    def _remember_status(response):
+        g._response_status = response.status_code
+        g._event_stream = response.mimetype == 'text/event-stream'
+        return response
+
+    # teardown runs after streamed responses finish, so CSV/XLSX downloads are timed in full
+    @app.teardown_request
+    def _record_request(exc):
+        start = g.pop('_request_start', None)
+        stats = g.pop('_query_stats', None)
+        # event streams stay open for minutes by design; their duration is not latency
+        if start is None or request.endpoint == 'metrics' or g.pop('_event_stream', False):
+            return
+        seconds = time.perf_counter() - start
+        endpoint = request.endpoint or 'not_found'
+        status = g.get('_response_status', 500)
+        statement, times = stats.statements.most_common(1)[0] if stats.statements else ('', 0)
+        repeated = times >= n_plus_one
+        slow = seconds >= slow_seconds
+        metrics.record(endpoint, request.method, status, seconds, stats, repeated, slow)
+        if repeated:
+            app.logger.warning("Possible N+1 on %s %s: statement ran %d times: %s",
+                               request.method, request.path, times, ' '.join(statement.split())[:200])
+        if slow:
+            app.logger.warning("Slow request %s %s -> %s in %.0f ms (%d queries, %.0f ms SQL)",
+                               request.method, request.full_path.rstrip('?'), status,
+                               seconds * 1000, stats.count, stats.seconds * 1000)
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.extensions['metrics'] = metrics
+    return metrics
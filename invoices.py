@@ -0,0 +1,154 @@
+"""Invoice routes: the HTML invoice, cached PDF rendering through a bounded wkhtmltopdf pool, and zips of a date range."""
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, current_app, flash, redirect, render_template, request, send_file, url_for
+from sqlalchemy.orm import joinedload
+
+from caching import conditional
+from jobs import RENDER_CACHE, job_stamp, job_total_paid, parse_date_arg
+from models import Job, JobArchive, get_job_or_404
+
+bp = Blueprint('invoices', __name__)
+log = logging.getLogger(__name__)
+
+PDF_RENDER_TIMEOUT = 60  # seconds
+INVOICE_ZIP_MAX_JOBS = 500
+
+@bp.route('/job/<int:job_id>/invoice')
+@conditional(job_stamp, cache=RENDER_CACHE)
+def invoice_html(job_id):
+    j = get_job_or_404(job_id)
+    return render_invoice_html(j)
+
+# --- invoice PDF cache: files are keyed by job id + a hash of everything the invoice shows ---
+_pdf_executor = None
+
+def pdf_executor():
+    global _pdf_executor
+    if _pdf_executor is None:
+        _pdf_executor = ThreadPoolExecutor(max_workers=current_app.config['PDF_RENDER_WORKERS'],
+                                           thread_name_prefix='pdf-render')
+    return _pdf_executor
+
+def render_pdf(html, wkhtmltopdf_path=None):
+    # try pdfkit (wkhtmltopdf). If WKHTMLTOPDF_PATH is set, use it. Runs on the pool, outside the app context;
+    # pdfkit is only imported here, so workers that never render a PDF never load it
+    import pdfkit
+    config = None
+    if wkhtmltopdf_path:
+        try:
+            config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+        except Exception as cex:
+            log.warning("Could not configure pdfkit with WKHTMLTOPDF_PATH=%s: %s", wkhtmltopdf_path, cex)
+            config = None
+    return pdfkit.from_string(html, False, configuration=config)
+
+def submit_pdf(html):
+    return pdf_executor().submit(render_pdf, html, current_app.config['WKHTMLTOPDF_PATH'])
+
+def invoice_fingerprint(job):
+    c = job.customer
+    parts = [job.id, job.created_at, job.tv_model, job.pickup_date, job.status, job.repair_work,
+             job.amount_charged, job.note, c.name, c.phone, c.address, job.paid_total,
+             os.path.getmtime(os.path.join(current_app.root_path, current_app.template_folder, 'invoice.html'))]
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()[:16]
+
+def invoice_cache_path(job_id, fingerprint):
+    return os.path.join(current_app.config['INVOICE_CACHE_FOLDER'], f"invoice_{job_id}_{fingerprint}.pdf")
+
+def drop_cached_invoices(job_id, keep=None):
+    for path in glob.glob(os.path.join(current_app.config['INVOICE_CACHE_FOLDER'], f"invoice_{job_id}_*.pdf")):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def render_invoice_html(job):
+    total_paid = job_total_paid(job)
+    return render_template(
+        "invoice.html",
+        job=job,
+        total_paid=total_paid,
+        remaining=job.balance_due,
+        generated_at=datetime.utcnow()
+    )
+
+def store_invoice_pdf(job_id, path, pdf):
+    tmp = f"{path}.{uuid.uuid4().hex}.part"
+    with open(tmp, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp, path)
+    drop_cached_invoices(job_id, keep=path)
+
+@bp.route('/job/<int:job_id>/invoice/pdf')
+def invoice_pdf(job_id):
+    j = get_job_or_404(job_id)
+    path = invoice_cache_path(j.id, invoice_fingerprint(j))
+    if os.path.exists(path):
+        return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=f"invoice_{job_id}.pdf")
+
+    html = render_invoice_html(j)
+    try:
+        pdf = submit_pdf(html).result(timeout=PDF_RENDER_TIMEOUT)
+        store_invoice_pdf(j.id, path, pdf)
+        return Response(pdf, mimetype='application/pdf', headers={"Content-Disposition": f"attachment;filename=invoice_{job_id}.pdf"})
+    except Exception as e:
+        current_app.logger.exception("PDF generation failed for job %s", job_id)
+        # fallback: return the HTML invoice; flash a visible message
+        flash("PDF not available. Use Print → Save as PDF.", "warning")
+        return html
+
+@bp.route('/invoices.zip')
+def invoices_zip():
+    start = parse_date_arg(request.args.get('start'))
+    end = parse_date_arg(request.args.get('end'))
+    if not start or not end:
+        flash('Start and end dates required (YYYY-MM-DD)', 'danger')
+        return redirect(request.referrer or url_for('jobs.jobs'))
+    jobs_in_range = []
+    for m in (Job, JobArchive):
+        jobs_q = (m.query.options(joinedload(m.customer))
+                  .filter(m.created_at >= start, m.created_at < end + timedelta(days=1))
+                  .order_by(m.created_at, m.id))
+        if request.args.get('status'):
+            jobs_q = jobs_q.filter(m.status == request.args['status'])
+        jobs_in_range += jobs_q.limit(INVOICE_ZIP_MAX_JOBS + 1 - len(jobs_in_range)).all()
+    if len(jobs_in_range) > INVOICE_ZIP_MAX_JOBS:
+        flash(f'Too many invoices in range (max {INVOICE_ZIP_MAX_JOBS}); narrow the dates', 'danger')
+        return redirect(request.referrer or url_for('jobs.jobs'))
+
+    # cache hits are zipped as-is; misses are rendered concurrently through the bounded pool
+    entries, pending = [], {}
+    for j in jobs_in_range:
+        path = invoice_cache_path(j.id, invoice_fingerprint(j))
+        entries.append((j.id, path))
+        if not os.path.exists(path):
+            pending[j.id] = (path, submit_pdf(render_invoice_html(j)))
+
+    errors = []
+    for job_id, (path, future) in pending.items():
+        try:
+            store_invoice_pdf(job_id, path, future.result(timeout=PDF_RENDER_TIMEOUT))
+        except Exception as exc:
+            current_app.logger.warning("PDF generation failed for job %s: %s", job_id, exc)
+            errors.append(f"invoice_{job_id}.pdf: {exc}")
+
+    out = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as zf:  # PDFs are already compressed
+        for job_id, path in entries:
+            if os.path.exists(path):
+                zf.write(path, f"invoice_{job_id}.pdf")
+        if errors:
+            zf.writestr('errors.txt', '\n'.join(errors))
+    out.seek(0)
+    return send_file(out, mimetype='application/zip', as_attachment=True,
+                     download_name=f"invoices_{start:%Y%m%d}_{end:%Y%m%d}.zip")
@@ -0,0 +1,431 @@
+"""Job routes: the front desk pages, listing/search, job entry (form and batch API), payments and completion."""
+import re
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+from sqlalchemy import and_, false, func, or_, select
+
+from caching import LRUCache, conditional, deploy_stamp
+from models import (Customer, Job, JobArchive, Payment, PaymentArchive, commit_unit, db, find_or_create_customer,
+                    get_job_or_404, normalize_phone)
+
+bp = Blueprint('jobs', __name__)
+
+SCREENSHOT_PATH = '/mnt/data/e1931f15-4839-40fb-8711-d4c3d283d76b.jpeg'  # your uploaded image
+
+# HELPERS
+def job_total_paid(job):
+    return job.paid_total or 0.0
+
+JOB_TEXT_FIELDS = ('area', 'tv_model', 'repair_work', 'payment_mode', 'pickup_date', 'note')
+
+def add_job(customer, fields, amount_charged=0.0, expense=0.0, advance=0.0, created_at=None, client_ref=None):
+    """Stage a new job for customer, with its advance as a payment, in the session; caller commits."""
+    job = Job(customer=customer, amount_charged=amount_charged, expense=expense, status='received',
+              client_ref=client_ref, **{k: fields.get(k) for k in JOB_TEXT_FIELDS})
+    if created_at is not None:
+        job.created_at = created_at
+    db.session.add(job)
+    if advance > 0:
+        db.session.add(Payment(job=job, amount=advance, payment_mode=job.payment_mode, note='advance',
+                               payment_date=created_at or datetime.utcnow()))
+    return job
+
+JOBS_PER_PAGE = 50
+JOBS_MAX_PER_PAGE = 200
+
+def jobs_listing_query():
+    # one row per job with customer name/phone and paid total, in a single query
+    return (db.session.query(Job, Customer.name, Customer.phone, Job.paid_total)
+            .join(Customer, Job.customer_id == Customer.id))
+
+def encode_job_cursor(job):
+    return f"{job.created_at.strftime('%Y-%m-%dT%H:%M:%S.%f')}_{job.id}"
+
+def decode_job_cursor(cursor):
+    # cursor format: <created_at iso>_<job id>; returns None if malformed
+    try:
+        ts, jid = cursor.rsplit('_', 1)
+        return datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S.%f'), int(jid)
+    except (ValueError, AttributeError):
+        return None
+
+def seek_jobs(q, cursor, per_page):
+    # newest first; rows strictly "older" than the cursor (created_at, id)
+    if cursor:
+        ts, jid = cursor
+        q = q.filter(or_(Job.created_at < ts, and_(Job.created_at == ts, Job.id < jid)))
+    rows = q.order_by(Job.created_at.desc(), Job.id.desc()).limit(per_page + 1).all()
+    next_cursor = encode_job_cursor(rows[per_page - 1][0]) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
+
+def page_size_arg():
+    try:
+        per_page = int(request.args.get('per_page', JOBS_PER_PAGE))
+    except ValueError:
+        per_page = JOBS_PER_PAGE
+    return max(1, min(per_page, JOBS_MAX_PER_PAGE))
+
+JOB_STATUSES = ['received', 'in_progress', 'completed']
+SEARCH_TEXT_FIELDS = ('q', 'name', 'phone', 'tv_model', 'area')
+SEARCH_ARGS = SEARCH_TEXT_FIELDS + ('status', 'start', 'end', 'match', 'owed')
+
+_fts_available = None
+
+def fts_available():
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (db.engine.dialect.name == 'sqlite' and
+                          db.session.execute(db.text("SELECT 1 FROM sqlite_master WHERE name='job_fts'")).first() is not None)
+    return _fts_available
+
+def binary_collated(expr):
+    # prefix ranges only cover every match under a binary collation: SQLite's default; on Postgres the
+    # comparisons (and the search indexes, see migration 15) use "C" rather than the database's locale
+    if db.engine.dialect.name == 'postgresql':
+        return expr.collate('C')
+    return expr
+
+def prefix_range(expr, prefix):
+    expr = binary_collated(expr)
+    return and_(expr >= prefix, expr < prefix + '\U0010ffff')
+
+def text_match(expr, term, mode):
+    # prefix matching is a range scan on the lower(col) expression index; substring needs a scan
+    term = term.lower()
+    if mode == 'contains':
+        return func.lower(expr).contains(term, autoescape=True)
+    return prefix_range(func.lower(expr), term)
+
+def phone_search_key(term):
+    # a typed (partial) phone number as a prefix of phone_normalized; None when term is not a number
+    compact = re.sub(r'[\s()-]', '', term or '')
+    if not re.fullmatch(r'\+?\d+', compact):
+        return None
+    # typed numbers may carry the +91 / 0 prefix that normalize_phone drops
+    key = normalize_phone(compact) if len(compact) > 10 else re.sub(r'^(\+91|0)', '', compact)
+    return key or None
+
+def phone_match(key, mode='prefix'):
+    # prefix is a range seek on the unique phone_normalized index; substring needs a scan
+    if mode == 'contains':
+        return Customer.phone_normalized.contains(key, autoescape=True)
+    return prefix_range(Customer.phone_normalized, key)
+
+def fts_query(term):
+    # quote each token so user input can't inject FTS syntax; trailing * = prefix match
+    tokens = [t.replace('"', '') for t in term.split()]
+    return ' '.join(f'"{t}"*' for t in tokens if t)
+
+def free_text_job_ids(term, mode):
+    # union of indexed lookups instead of one OR across joined tables
+    term = term.strip()
+    phone_key = phone_search_key(term)
+    cust_cond = text_match(Customer.name, term, mode)
+    if phone_key:
+        cust_cond = or_(cust_cond, phone_match(phone_key, mode))
+    parts = [
+        select(Job.id).where(Job.customer_id.in_(select(Customer.id).where(cust_cond))),
+        select(Job.id).where(text_match(Job.tv_model, term, mode)),
+        select(Job.id).where(text_match(Job.area, term, mode)),
+    ]
+    fts = fts_query(term)
+    if fts and fts_available():
+        parts.append(select(db.literal_column('rowid')).select_from(db.text('job_fts'))
+                     .where(db.text('job_fts MATCH :fts').bindparams(fts=fts)))
+    else:
+        parts.append(select(Job.id).where(or_(Job.repair_work.contains(term, autoescape=True),
+                                              Job.note.contains(term, autoescape=True))))
+    return db.union(*parts)
+
+def parse_date_arg(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+def apply_job_search(q, args):
+    mode = 'contains' if args.get('match') == 'contains' else 'prefix'
+    term = (args.get('q') or '').strip()
+    if term:
+        q = q.filter(Job.id.in_(free_text_job_ids(term, mode)))
+    if args.get('name'):
+        q = q.filter(Job.customer_id.in_(select(Customer.id).where(text_match(Customer.name, args['name'].strip(), mode))))
+    if args.get('phone'):
+        phone_key = phone_search_key(args['phone'])
+        cond = phone_match(phone_key, mode) if phone_key else false()
+        q = q.filter(Job.customer_id.in_(select(Customer.id).where(cond)))
+    if args.get('tv_model'):
+        q = q.filter(text_match(Job.tv_model, args['tv_model'].strip(), mode))
+    if args.get('area'):
+        q = q.filter(text_match(Job.area, args['area'].strip(), mode))
+    if args.get('status'):
+        q = q.filter(Job.status == args['status'])
+    if args.get('owed'):
+        q = q.filter(Job.balance_due > 0.005)
+    start = parse_date_arg(args.get('start'))
+    if start:
+        q = q.filter(Job.created_at >= start)
+    end = parse_date_arg(args.get('end'))
+    if end:
+        q = q.filter(Job.created_at < end + timedelta(days=1))
+    return q
+
+def job_row_dict(job, cust_name, cust_phone, total_paid):
+    return {
+        'id': job.id,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'customer_name': cust_name,
+        'customer_phone': cust_phone,
+        'area': job.area,
+        'tv_model': job.tv_model,
+        'repair_work': job.repair_work,
+        'amount_charged': float(job.amount_charged or 0.0),
+        'expense': float(job.expense or 0.0),
+        'total_paid': float(total_paid or 0.0),
+        'remaining': float(job.balance_due or 0.0),
+        'status': job.status,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+# ------------------ HTTP CACHING ------------------
+# the shop tablets keep refreshing job pages, invoices and summaries; those routes answer a matching
+# If-None-Match with 304 from the cheap stamps below (see caching.py), and job pages/invoices are
+# replayed from RENDER_CACHE when another client already rendered the same version (sized by
+# RENDER_CACHE_SIZE when the blueprint is registered)
+RENDER_CACHE = LRUCache(0)
+
+@bp.record_once
+def _size_render_cache(state):
+    RENDER_CACHE.maxsize = state.app.config['RENDER_CACHE_SIZE']
+
+def job_stamp(job_id):
+    # job and customer row plus its payments, one indexed query (per table: hot, then archive);
+    # None (-> the view 404s) if missing
+    for job_model, payment_model in ((Job, Payment), (JobArchive, PaymentArchive)):
+        row = db.session.execute(
+            select(job_model.updated_at, Customer.name, Customer.phone, Customer.address,
+                   func.count(payment_model.id), func.max(payment_model.id))
+            .join(Customer, job_model.customer_id == Customer.id)
+            .outerjoin(payment_model, payment_model.job_id == job_model.id)
+            .where(job_model.id == job_id)
+            .group_by(job_model.id, Customer.id)).first()
+        if row is not None:
+            return (deploy_stamp(), job_model.__tablename__, *row), row.updated_at
+    return None
+
+# ROUTES (your original routes left intact)
+@bp.route('/')
+def index():
+    # show simple form-first page
+    recent_jobs = Job.query.order_by(Job.created_at.desc()).limit(10).all()
+    return render_template('index.html', recent_jobs=recent_jobs, screenshot_url=SCREENSHOT_PATH)
+
+@bp.route('/jobs')
+def jobs():
+    per_page = page_size_arg()
+    cursor = request.args.get('cursor')
+    rows, next_cursor = seek_jobs(jobs_listing_query(), decode_job_cursor(cursor), per_page)
+    return render_template('jobs.html', rows=rows, next_cursor=next_cursor, is_first_page=not cursor,
+                           page_args={'per_page': per_page}, search={}, statuses=JOB_STATUSES)
+
+def search_args():
+    return {k: request.args[k] for k in SEARCH_ARGS if request.args.get(k)}
+
+@bp.route('/jobs/search')
+def jobs_search():
+    per_page = page_size_arg()
+    cursor = request.args.get('cursor')
+    args = search_args()
+    rows, next_cursor = seek_jobs(apply_job_search(jobs_listing_query(), args), decode_job_cursor(cursor), per_page)
+    return render_template('jobs.html', rows=rows, next_cursor=next_cursor, is_first_page=not cursor,
+                           page_args=dict(args, per_page=per_page), search=args, statuses=JOB_STATUSES)
+
+@bp.route('/api/jobs/search')
+def api_jobs_search():
+    per_page = page_size_arg()
+    args = search_args()
+    rows, next_cursor = seek_jobs(apply_job_search(jobs_listing_query(), args), decode_job_cursor(request.args.get('cursor')), per_page)
+    return jsonify({'results': [job_row_dict(*r) for r in rows], 'next_cursor': next_cursor})
+
+@bp.route('/job/<int:job_id>')
+@conditional(job_stamp, cache=RENDER_CACHE)
+def job_detail(job_id):
+    j = get_job_or_404(job_id)
+    return render_template('job_detail.html', job=j, total_paid=job_total_paid(j), remaining=j.balance_due)
+
+@bp.route('/new_job', methods=['POST'])
+def new_job():
+    # allow selecting existing customer by id or creating inline; customer, job and advance
+    # payment are committed together
+    form = request.form
+    cid = form.get('customer_id')
+    if not cid and not form.get('cust_name'):
+        flash('Customer name required', 'danger')
+        return redirect(url_for('jobs.index'))
+    try:
+        amounts = {k: float(form.get(f) or 0) for k, f in
+                   (('amount_charged', 'amount_charged'), ('expense', 'expense'), ('advance', 'advance_amount'))}
+    except ValueError:
+        flash('Invalid amount', 'danger')
+        return redirect(url_for('jobs.index'))
+
+    def work():
+        if cid:
+            customer = db.session.get(Customer, int(cid))
+            if customer is None:
+                abort(404)
+        else:
+            # repeat walk-ins are matched by phone number instead of creating a duplicate customer
+            customer, _ = find_or_create_customer(form['cust_name'], form.get('cust_phone'), form.get('cust_address'))
+        job = add_job(customer, form, **amounts)
+        db.session.flush()
+        return job.id
+
+    job_id = commit_unit(work)
+    flash('Job created', 'success')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
+
+# --- batch job entry: the mobile app syncs its offline queue in one request and one transaction ---
+JOBS_BATCH_MAX = 500
+
+def _batch_text(entry, key, max_len=None):
+    value = entry.get(key)
+    if value is None or value == '':
+        return None
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError(f"{key}: expected a string")
+    value = str(value).strip()
+    if max_len and len(value) > max_len:
+        raise ValueError(f"{key}: longer than {max_len} characters")
+    return value or None
+
+def _batch_amount(entry, key):
+    value = entry.get(key)
+    if value in (None, ''):
+        return 0.0
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key}: not a number ({value!r})")
+    if amount < 0:
+        raise ValueError(f"{key}: must not be negative")
+    return amount
+
+def _batch_timestamp(entry, key):
+    value = entry.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        when = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{key}: expected an ISO 8601 timestamp ({value!r})")
+    # stored as naive UTC like every other timestamp
+    return when.astimezone(timezone.utc).replace(tzinfo=None) if when.tzinfo else when
+
+def parse_batch_job(entry):
+    """(customer spec, add_job kwargs) for one /api/jobs/batch entry; raises ValueError."""
+    if not isinstance(entry, dict):
+        raise ValueError("expected an object")
+    cust = entry.get('customer')
+    if entry.get('customer_id') is not None:
+        if not isinstance(entry['customer_id'], int) or isinstance(entry['customer_id'], bool):
+            raise ValueError("customer_id: expected an integer")
+        customer = {'id': entry['customer_id']}
+    elif isinstance(cust, dict) and _batch_text(cust, 'name'):
+        customer = {'name': _batch_text(cust, 'name', 200), 'phone': _batch_text(cust, 'phone', 50),
+                    'address': _batch_text(cust, 'address', 500)}
+    else:
+        raise ValueError("customer_id or customer.name required")
+    job = dict(fields={k: _batch_text(entry, k) for k in JOB_TEXT_FIELDS},
+               amount_charged=_batch_amount(entry, 'amount_charged'), expense=_batch_amount(entry, 'expense'),
+               advance=_batch_amount(entry, 'advance'), created_at=_batch_timestamp(entry, 'created_at'),
+               client_ref=_batch_text(entry, 'client_ref', 64))
+    return customer, job
+
+@bp.route('/api/jobs/batch', methods=['POST'])
+def api_jobs_batch():
+    """Create many jobs, with inline customers and advances, all or nothing.
+
+    Body: {"jobs": [{"client_ref", "customer_id" | "customer": {"name", "phone", "address"},
+    "area", "tv_model", "repair_work", "amount_charged", "expense", "advance", "payment_mode",
+    "pickup_date", "note", "created_at"}, ...]}. Entries whose client_ref was already synced are
+    not created again, so a queue can be resent after a lost response.
+    """
+    payload = request.get_json(silent=True)
+    entries = payload.get('jobs') if isinstance(payload, dict) else None
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'expected a JSON object with a non-empty "jobs" list'}), 400
+    if len(entries) > JOBS_BATCH_MAX:
+        return jsonify({'error': f'at most {JOBS_BATCH_MAX} jobs per batch'}), 413
+
+    parsed, errors, refs = [], [], set()
+    for i, entry in enumerate(entries):
+        try:
+            customer, job = parse_batch_job(entry)
+            if job['client_ref'] is not None:
+                if job['client_ref'] in refs:
+                    raise ValueError(f"client_ref {job['client_ref']!r} repeated in this batch")
+                refs.add(job['client_ref'])
+            parsed.append((i, customer, job))
+        except ValueError as exc:
+            errors.append({'index': i, 'client_ref': entry.get('client_ref') if isinstance(entry, dict) else None,
+                           'error': str(exc)})
+    wanted = {c['id'] for _, c, _ in parsed if 'id' in c}
+    found = set(db.session.execute(select(Customer.id).where(Customer.id.in_(wanted))).scalars()) if wanted else set()
+    errors += [{'index': i, 'client_ref': job['client_ref'], 'error': f"customer_id {c['id']} not found"}
+               for i, c, job in parsed if 'id' in c and c['id'] not in found]
+    if errors:
+        return jsonify({'errors': sorted(errors, key=lambda e: e['index'])}), 400
+
+    def work():
+        synced = {r.client_ref: r for r in db.session.execute(
+            select(Job.client_ref, Job.id, Job.customer_id).where(Job.client_ref.in_(refs)))} if refs else {}
+        staged = []
+        for i, c, job in parsed:
+            ref = job['client_ref']
+            if ref in synced:
+                staged.append((i, ref, synced[ref], False))
+                continue
+            customer = db.session.get(Customer, c['id']) if 'id' in c else find_or_create_customer(**c)[0]
+            staged.append((i, ref, add_job(customer, **job), True))
+        db.session.flush()
+        return [{'index': i, 'client_ref': ref, 'job_id': j.id, 'customer_id': j.customer_id, 'created': created}
+                for i, ref, j, created in staged]
+
+    results = commit_unit(work)
+    created = sum(r['created'] for r in results)
+    current_app.logger.info("Batch job entry: %d created, %d already synced", created, len(results) - created)
+    return jsonify({'results': results, 'created': created}), 201 if created else 200
+
+@bp.route('/job/<int:job_id>/add_payment', methods=['POST'])
+def add_payment(job_id):
+    job = Job.query.get_or_404(job_id)
+    amt = float(request.form.get('amount') or 0)
+    if amt <= 0:
+        flash('Amount must be positive', 'danger')
+        return redirect(request.referrer or url_for('jobs.job_detail', job_id=job_id))
+    p = Payment(job_id=job.id, amount=amt, payment_mode=request.form.get('payment_mode'), note=request.form.get('note'))
+    db.session.add(p); db.session.commit()
+    flash('Payment recorded', 'success')
+    return redirect(request.referrer or url_for('jobs.job_detail', job_id=job_id))
+
+@bp.route('/job/<int:job_id>/complete', methods=['POST'])
+def complete(job_id):
+    job = Job.query.get_or_404(job_id)
+    job.status = 'completed'
+    job.completed_at = datetime.utcnow()
+    db.session.commit()
+    flash('Job marked completed', 'success')
+    return redirect(request.referrer or url_for('jobs.job_detail', job_id=job_id))
+
+@bp.route('/job/<int:job_id>/delete', methods=['POST'])
+def delete_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    db.session.delete(job)
+    db.session.commit()
+    from invoices import drop_cached_invoices  # invoices imports this module
+    drop_cached_invoices(job_id)
+    flash('Job deleted', 'success')
+    return redirect(url_for('jobs.jobs'))
@@ -0,0 +1,503 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in version order, inside its own transaction, and records
+itself in the ``schema_version`` table. Migrations are written to be idempotent so
+databases created by older versions of the app (``db.create_all()`` plus the old
+``migrate_add_job_columns.py``) can be brought up to date from version 1.
+
+Every migration spells out the tables and indexes it creates as they were at its version instead
+of reading them from the models, so a fresh database goes through exactly the same steps as an old
+one, whatever the models look like today.
+
+Run with ``flask --app app migrate`` (``--status`` lists applied/pending versions).
+"""
+from datetime import datetime
+
+from sqlalchemy import (Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+                        bindparam, func, inspect, select, text)
+from sqlalchemy.schema import CreateIndex
+
+MIGRATIONS = []
+
+version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def applied_versions(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return set()
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def pending_migrations(engine):
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(engine, log=print):
+    """Apply every pending migration; returns the versions applied."""
+    with engine.begin() as conn:
+        version_metadata.create_all(conn, checkfirst=True)
+    applied = []
+    for version, description, fn in pending_migrations(engine):
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(schema_version.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+        log(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+# helpers ---------------------------------------------------------------------
+
+def create_tables(conn, *tables):
+    tables[0].metadata.create_all(conn, tables=list(tables), checkfirst=True)
+
+
+def columns_of(metadata, table, *names):
+    # just enough of an existing table to write index DDL against
+    return Table(table, metadata, *(Column(n) for n in names))
+
+
+def create_indexes(conn, *indexes):
+    for index in indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def add_missing_columns(conn, table, columns):
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def sqlite_table_shape(conn, name):
+    # (columns as (name, type, notnull, default, pk), foreign keys, row count)
+    columns = [tuple(r[1:]) for r in conn.exec_driver_sql(f"PRAGMA table_info('{name}')")]
+    foreign_keys = sorted(tuple(r[2:5]) for r in conn.exec_driver_sql(f"PRAGMA foreign_key_list('{name}')"))
+    count = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {name}").scalar()
+    return columns, foreign_keys, count
+
+
+def rebuild_with_autoincrement(conn, name):
+    """Rebuild SQLite table `name` with AUTOINCREMENT on its integer `id` primary key.
+
+    The documented SQLite rebuild (new table, copy, drop, rename). The new table is built from the
+    live one column for column, so columns the models no longer know (legacy ones in old databases)
+    keep their data and exact types. Indexes and triggers go with the old table; callers recreate
+    them. Tables it cannot reproduce are refused, and the copy is checked before the old table is
+    dropped.
+    """
+    rebuilt = f'{name}_rebuilt'
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                       {'name': name}).scalar()
+    columns, foreign_keys, count = sqlite_table_shape(conn, name)
+    if [c[0] for c in columns if c[4]] != ['id'] or any(w in ddl.upper() for w in ('UNIQUE', 'CHECK', 'COLLATE')):
+        raise RuntimeError(f"{name}: unexpected table definition, not rebuilding it:\n{ddl}")
+    parts = []
+    for column, type_, notnull, default, pk in columns:
+        if pk:
+            parts.append(f'"{column}" INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT')
+        else:
+            parts.append(f'"{column}" {type_}' + (' NOT NULL' if notnull else '')
+                         + (f' DEFAULT {default}' if default is not None else ''))
+    for table, src, dst in foreign_keys:
+        parts.append(f'FOREIGN KEY("{src}") REFERENCES "{table}" ("{dst}")')
+    cols = ', '.join(f'"{c[0]}"' for c in columns)
+    conn.exec_driver_sql(f"DROP TABLE IF EXISTS {rebuilt}")  # left over from an interrupted run
+    conn.exec_driver_sql(f"CREATE TABLE {rebuilt} (\n\t" + ', \n\t'.join(parts) + "\n)")
+    conn.exec_driver_sql(f"INSERT INTO {rebuilt} ({cols}) SELECT {cols} FROM {name}")
+    if sqlite_table_shape(conn, rebuilt) != (columns, foreign_keys, count):
+        raise RuntimeError(f"{name}: the rebuilt table does not match the original, not replacing it")
+    conn.exec_driver_sql(f"DROP TABLE {name}")
+    conn.exec_driver_sql(f"ALTER TABLE {rebuilt} RENAME TO {name}")
+
+
+# migrations ------------------------------------------------------------------
+
+@migration(1, 'initial tables')
+def initial_tables(conn):
+    # the tables db.create_all() made before migrations existed
+    md = MetaData()
+    customer = Table(
+        'customer', md,
+        Column('id', Integer, primary_key=True),
+        Column('name', String(200), nullable=False),
+        Column('phone', String(50)),
+        Column('address', String(500)),
+        Column('created_at', DateTime),
+    )
+    job = Table(
+        'job', md,
+        Column('id', Integer, primary_key=True),
+        Column('customer_id', Integer, ForeignKey('customer.id'), nullable=False),
+        Column('area', String(200)),
+        Column('tv_model', String(300)),
+        Column('repair_work', Text),
+        Column('amount_charged', Float),
+        Column('expense', Float),
+        Column('payment_mode', String(50)),
+        Column('pickup_date', String(50)),
+        Column('note', Text),
+        Column('status', String(50)),
+        Column('created_at', DateTime),
+        Column('completed_at', DateTime),
+    )
+    payment = Table(
+        'payment', md,
+        Column('id', Integer, primary_key=True),
+        Column('job_id', Integer, ForeignKey('job.id'), nullable=False),
+        Column('amount', Float, nullable=False),
+        Column('payment_mode', String(50)),
+        Column('note', String(200)),
+        Column('payment_date', DateTime),
+    )
+    expense = Table(
+        'expense', md,
+        Column('id', Integer, primary_key=True),
+        Column('description', String(300)),
+        Column('amount', Float, nullable=False),
+        Column('date', Date),
+        Column('created_at', DateTime),
+    )
+    create_tables(conn, customer, job, payment, expense)
+
+
+@migration(2, 'spreadsheet columns on job')
+def job_spreadsheet_columns(conn):
+    # formerly migrate_add_job_columns.py
+    add_missing_columns(conn, 'job', [
+        ('area', 'TEXT'),
+        ('tv_model', 'TEXT'),
+        ('repair_work', 'TEXT'),
+        ('expense', 'REAL DEFAULT 0.0'),
+        ('note', 'TEXT'),
+        ('payment_mode', 'TEXT'),
+    ])
+
+
+@migration(3, 'job.paid_total and job.balance_due')
+def job_balances(conn):
+    existing = {c['name'] for c in inspect(conn).get_columns('job')}
+    add_missing_columns(conn, 'job', [
+        ('paid_total', 'FLOAT NOT NULL DEFAULT 0'),
+        ('balance_due', 'FLOAT NOT NULL DEFAULT 0'),
+    ])
+    if {'paid_total', 'balance_due'} - existing:
+        conn.execute(text(
+            "UPDATE job SET "
+            "paid_total = (SELECT COALESCE(SUM(amount), 0) FROM payment WHERE payment.job_id = job.id), "
+            "balance_due = COALESCE(amount_charged, 0) - "
+            "(SELECT COALESCE(SUM(amount), 0) FROM payment WHERE payment.job_id = job.id)"))
+
+
+@migration(4, 'indexes on foreign keys and date columns')
+def core_indexes(conn):
+    md = MetaData()
+    job = columns_of(md, 'job', 'id', 'customer_id', 'created_at', 'completed_at', 'balance_due')
+    payment = columns_of(md, 'payment', 'job_id', 'payment_date')
+    expense = columns_of(md, 'expense', 'date')
+    create_indexes(
+        conn,
+        Index('ix_job_customer_id', job.c.customer_id),
+        Index('ix_job_created_at_id', job.c.created_at, job.c.id),
+        Index('ix_job_completed_at', job.c.completed_at),
+        Index('ix_job_balance_due', job.c.balance_due),
+        Index('ix_payment_job_id', payment.c.job_id),
+        Index('ix_payment_payment_date', payment.c.payment_date),
+        Index('ix_expense_date', expense.c.date),
+    )
+
+
+# full-text index over the free-text job fields, kept in sync by triggers (SQLite FTS5)
+JOB_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS job_fts USING fts5(repair_work, note, content='job', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS job_fts_ai AFTER INSERT ON job BEGIN "
+    "INSERT INTO job_fts(rowid, repair_work, note) VALUES (new.id, new.repair_work, new.note); END",
+    "CREATE TRIGGER IF NOT EXISTS job_fts_ad AFTER DELETE ON job BEGIN "
+    "INSERT INTO job_fts(job_fts, rowid, repair_work, note) VALUES ('delete', old.id, old.repair_work, old.note); END",
+    "CREATE TRIGGER IF NOT EXISTS job_fts_au AFTER UPDATE OF repair_work, note ON job BEGIN "
+    "INSERT INTO job_fts(job_fts, rowid, repair_work, note) VALUES ('delete', old.id, old.repair_work, old.note); "
+    "INSERT INTO job_fts(rowid, repair_work, note) VALUES (new.id, new.repair_work, new.note); END",
+]
+
+
+@migration(5, 'search indexes and job_fts')
+def search_indexes(conn):
+    md = MetaData()
+    customer = columns_of(md, 'customer', 'phone', 'name')
+    job = columns_of(md, 'job', 'status', 'created_at', 'tv_model', 'area')
+    create_indexes(
+        conn,
+        Index('ix_customer_phone', customer.c.phone),
+        Index('ix_customer_name_lower', func.lower(customer.c.name)),
+        Index('ix_job_status_created_at', job.c.status, job.c.created_at),
+        Index('ix_job_tv_model_lower', func.lower(job.c.tv_model)),
+        Index('ix_job_area_lower', func.lower(job.c.area)),
+    )
+    if conn.dialect.name != 'sqlite':
+        return
+    compile_options = set(conn.exec_driver_sql("PRAGMA compile_options").scalars())
+    if 'ENABLE_FTS5' not in compile_options:
+        return  # search falls back to LIKE
+    existed = conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name='job_fts'").first()
+    for stmt in JOB_FTS_DDL:
+        conn.exec_driver_sql(stmt)
+    if not existed:
+        conn.exec_driver_sql("INSERT INTO job_fts(job_fts) VALUES ('rebuild')")
+
+
+@migration(6, 'daily_ledger rollup')
+def daily_ledger(conn):
+    if inspect(conn).has_table('daily_ledger'):
+        return
+    ledger = Table(
+        'daily_ledger', MetaData(),
+        Column('day', Date, primary_key=True),
+        *(Column(name, Float, nullable=False) for name in
+          ('payments_total', 'jobs_amount_total', 'jobs_expense_total', 'expenses_total')),
+        *(Column(name, Integer, nullable=False) for name in
+          ('payments_count', 'jobs_completed_count', 'expenses_count')),
+    )
+    create_tables(conn, ledger)
+    # same result as `flask rebuild-ledger`, in one statement
+    conn.execute(text(
+        "INSERT INTO daily_ledger (day, payments_total, payments_count, jobs_amount_total, jobs_expense_total, "
+        "jobs_completed_count, expenses_total, expenses_count) "
+        "SELECT day, SUM(pt), SUM(pc), SUM(ja), SUM(je), SUM(jc), SUM(et), SUM(ec) FROM ("
+        " SELECT DATE(payment_date) AS day, COALESCE(amount, 0) AS pt, 1 AS pc, 0 AS ja, 0 AS je, 0 AS jc, 0 AS et, 0 AS ec"
+        " FROM payment WHERE payment_date IS NOT NULL"
+        " UNION ALL"
+        " SELECT DATE(completed_at), 0, 0, COALESCE(amount_charged, 0), COALESCE(expense, 0), 1, 0, 0"
+        " FROM job WHERE completed_at IS NOT NULL"
+        " UNION ALL"
+        " SELECT DATE(\"date\"), 0, 0, 0, 0, 0, COALESCE(amount, 0), 1"
+        " FROM expense WHERE \"date\" IS NOT NULL"
+        ") AS contributions GROUP BY day"))
+
+
+@migration(7, 'import_checkpoint table')
+def import_checkpoint(conn):
+    create_tables(conn, Table(
+        'import_checkpoint', MetaData(),
+        Column('file_hash', String(64), primary_key=True),
+        Column('filename', String(300)),
+        Column('kind', String(20)),
+        Column('rows_done', Integer, nullable=False),
+        Column('finished_at', DateTime),
+        Column('updated_at', DateTime),
+    ))
+
+
+@migration(8, 'data_version write counter')
+def data_version(conn):
+    t = Table(
+        'data_version', MetaData(),
+        Column('name', String(50), primary_key=True),
+        Column('version', Integer, nullable=False),
+    )
+    create_tables(conn, t)
+    if conn.execute(select(t.c.name).where(t.c.name == 'reports')).first() is None:
+        conn.execute(t.insert().values(name='reports', version=0))
+
+
+def _normalize_phone(raw):
+    # app.normalize_phone as of this migration: last 10 digits, None without digits
+    digits = ''.join(ch for ch in str(raw or '') if ch.isdigit())
+    return digits[-10:] or None
+
+
+@migration(9, 'customer.phone_normalized (unique), duplicate customers merged')
+def customer_phone_normalized(conn):
+    add_missing_columns(conn, 'customer', [('phone_normalized', 'VARCHAR(20)')])
+    groups = {}
+    for row in conn.execute(text("SELECT id, name, address, phone FROM customer ORDER BY id")):
+        key = _normalize_phone(row.phone)
+        if key:
+            groups.setdefault(key, []).append(row)
+    # the oldest row of each phone number survives with every job and keeps its own name and
+    # address; only a blank one is filled from the most recently entered duplicate that has it
+    move_jobs = text("UPDATE job SET customer_id = :keep WHERE customer_id IN :ids").bindparams(
+        bindparam('ids', expanding=True))
+    delete = text("DELETE FROM customer WHERE id IN :ids").bindparams(bindparam('ids', expanding=True))
+    keys = []
+    for key, rows in groups.items():
+        keep, dups = rows[0], rows[1:]
+        if dups:
+            ids = [r.id for r in dups]
+            conn.execute(move_jobs, {'keep': keep.id, 'ids': ids})
+            conn.execute(delete, {'ids': ids})
+            name = keep.name or next((r.name for r in reversed(dups) if r.name), keep.name)
+            address = keep.address or next((r.address for r in reversed(dups) if r.address), keep.address)
+            conn.execute(text("UPDATE customer SET name = :name, address = :address WHERE id = :id"),
+                         {'name': name, 'address': address, 'id': keep.id})
+        keys.append({'k': key, 'i': keep.id})
+    if keys:
+        conn.execute(text("UPDATE customer SET phone_normalized = :k WHERE id = :i"), keys)
+    # (customer_id, created_at, id) serves the per-customer history newest-first and replaces ix_job_customer_id
+    md = MetaData()
+    customer = columns_of(md, 'customer', 'phone_normalized')
+    job = columns_of(md, 'job', 'id', 'customer_id', 'created_at')
+    create_indexes(
+        conn,
+        Index('ix_customer_phone_normalized', customer.c.phone_normalized, unique=True),
+        Index('ix_job_customer_created', job.c.customer_id, job.c.created_at, job.c.id),
+    )
+    conn.execute(text("DROP INDEX IF EXISTS ix_job_customer_id"))
+
+
+@migration(10, 'job.updated_at and data_version.updated_at')
+def updated_at_columns(conn):
+    timestamp = DateTime().compile(dialect=conn.dialect)  # DATETIME on SQLite, TIMESTAMP on Postgres
+    existing = {c['name'] for c in inspect(conn).get_columns('job')}
+    add_missing_columns(conn, 'job', [('updated_at', timestamp)])
+    if 'updated_at' not in existing:
+        # best guess for old rows: the latest of creation, completion and last payment
+        conn.execute(text("UPDATE job SET updated_at = created_at"))
+        conn.execute(text("UPDATE job SET updated_at = completed_at WHERE completed_at > updated_at"))
+        last_payment = "(SELECT MAX(payment_date) FROM payment WHERE payment.job_id = job.id)"
+        conn.execute(text(f"UPDATE job SET updated_at = {last_payment} WHERE {last_payment} > updated_at"))
+    add_missing_columns(conn, 'data_version', [('updated_at', timestamp)])
+    conn.execute(text("UPDATE data_version SET updated_at = :now WHERE updated_at IS NULL"), {'now': datetime.utcnow()})
+
+
+@migration(11, 'job.client_ref for batch job entry')
+def job_client_ref(conn):
+    add_missing_columns(conn, 'job', [('client_ref', 'VARCHAR(64)')])
+    job = columns_of(MetaData(), 'job', 'client_ref')
+    create_indexes(conn, Index('ix_job_client_ref', job.c.client_ref, unique=True))
+
+
+@migration(12, 'event_outbox for the live event feed')
+def event_outbox(conn):
+    create_tables(conn, Table(
+        'event_outbox', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('kind', String(30), nullable=False),
+        Column('data', Text, nullable=False),
+        Column('created_at', DateTime, nullable=False),
+        sqlite_autoincrement=True,
+    ))
+
+
+@migration(13, 'job_archive and payment_archive')
+def archive_tables(conn):
+    md = MetaData()
+    columns_of(md, 'customer', 'id')  # target of the foreign key only; not created
+    job_archive = Table(
+        'job_archive', md,
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('customer_id', Integer, ForeignKey('customer.id'), nullable=False),
+        Column('area', String(200)),
+        Column('tv_model', String(300)),
+        Column('repair_work', Text),
+        Column('amount_charged', Float),
+        Column('expense', Float),
+        Column('payment_mode', String(50)),
+        Column('pickup_date', String(50)),
+        Column('note', Text),
+        Column('status', String(50)),
+        Column('created_at', DateTime),
+        Column('completed_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('client_ref', String(64)),
+        Column('paid_total', Float, nullable=False),
+        Column('balance_due', Float, nullable=False),
+        Column('archived_at', DateTime, nullable=False),
+        Index('ix_job_archive_customer_created', 'customer_id', 'created_at', 'id'),
+        Index('ix_job_archive_created_at_id', 'created_at', 'id'),
+        Index('ix_job_archive_completed_at', 'completed_at'),
+    )
+    payment_archive = Table(
+        'payment_archive', md,
+        Column('id', Integer, primary_key=True, autoincrement=False),
+        Column('job_id', Integer, ForeignKey('job_archive.id'), nullable=False),
+        Column('amount', Float, nullable=False),
+        Column('payment_mode', String(50)),
+        Column('note', String(200)),
+        Column('payment_date', DateTime),
+        Index('ix_payment_archive_job_id', 'job_id'),
+        Index('ix_payment_archive_payment_date', 'payment_date'),
+    )
+    create_tables(conn, job_archive, payment_archive)
+
+
+@migration(14, 'job and payment ids never reused')
+def autoincrement_ids(conn):
+    # without AUTOINCREMENT SQLite hands out max(id) + 1, so deleting the newest job or payment
+    # let its id (or an archived one below it) be given out again; rebuild both tables with it and
+    # start their counters above every hot and archived id
+    if conn.dialect.name != 'sqlite':
+        # serial sequences never go back by themselves; make sure they are past the archive
+        for name in ('job', 'payment'):
+            seq = f"pg_get_serial_sequence('{name}', 'id')"
+            conn.exec_driver_sql(f"SELECT setval({seq}, GREATEST(nextval({seq}), "
+                                 f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {name}_archive)), false)")
+        return
+    for name in ('job', 'payment'):
+        ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                           {'name': name}).scalar()
+        if 'AUTOINCREMENT' not in ddl.upper():
+            rebuild_with_autoincrement(conn, name)
+        high = conn.exec_driver_sql(f"SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM {name}), "
+                                    f"(SELECT COALESCE(MAX(id), 0) FROM {name}_archive))").scalar()
+        conn.execute(text("DELETE FROM sqlite_sequence WHERE name IN (:name, :rebuilt)"),
+                     {'name': name, 'rebuilt': f'{name}_rebuilt'})
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {'name': name, 'seq': high})
+
+    md = MetaData()
+    job = columns_of(md, 'job', 'id', 'customer_id', 'created_at', 'completed_at', 'balance_due', 'status',
+                     'tv_model', 'area', 'client_ref')
+    payment = columns_of(md, 'payment', 'job_id', 'payment_date')
+    create_indexes(
+        conn,
+        Index('ix_job_created_at_id', job.c.created_at, job.c.id),
+        Index('ix_job_customer_created', job.c.customer_id, job.c.created_at, job.c.id),
+        Index('ix_job_status_created_at', job.c.status, job.c.created_at),
+        Index('ix_job_balance_due', job.c.balance_due),
+        Index('ix_job_completed_at', job.c.completed_at),
+        Index('ix_job_client_ref', job.c.client_ref, unique=True),
+        Index('ix_job_tv_model_lower', func.lower(job.c.tv_model)),
+        Index('ix_job_area_lower', func.lower(job.c.area)),
+        Index('ix_payment_job_id', payment.c.job_id),
+        Index('ix_payment_payment_date', payment.c.payment_date),
+    )
+    if conn.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name='job_fts'").first():
+        # the index itself is keyed by job id, which the rebuild kept; only the triggers went with the table
+        for stmt in JOB_FTS_DDL[1:]:
+            conn.exec_driver_sql(stmt)
+
+
+@migration(15, 'search indexes in the "C" collation on Postgres')
+def binary_collated_search_indexes(conn):
+    # prefix search is a range scan (jobs.prefix_range), which can miss matches under a locale collation;
+    # SQLite always compares these columns bytewise, on Postgres queries and indexes both use "C"
+    if conn.dialect.name != 'postgresql':
+        return
+    md = MetaData()
+    customer = columns_of(md, 'customer', 'name', 'phone_normalized')
+    job = columns_of(md, 'job', 'tv_model', 'area')
+    indexes = [
+        Index('ix_customer_name_lower', func.lower(customer.c.name).collate('C')),
+        Index('ix_customer_phone_normalized', customer.c.phone_normalized.collate('C'), unique=True),
+        Index('ix_job_tv_model_lower', func.lower(job.c.tv_model).collate('C')),
+        Index('ix_job_area_lower', func.lower(job.c.area).collate('C')),
+    ]
+    for index in indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    create_indexes(conn, *indexes)
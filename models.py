@@ -0,0 +1,560 @@
+"""Models, the write-side bookkeeping kept in step with them, and the customer/unit-of-work helpers.
+
+Every write to jobs, payments and expenses maintains the daily_ledger rollup, Job.paid_total/balance_due,
+the data_version counters and the event outbox in its own transaction, through the mapper and session
+events below; the blueprints only add, change and commit rows.
+"""
+import json
+from datetime import datetime, timedelta, date
+
+from flask import abort, current_app
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, or_, select, event, inspect, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.util import identity_key
+
+db = SQLAlchemy()
+
+# MODELS
+class Customer(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    phone = db.Column(db.String(50))
+    address = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # last 10 digits of phone (see normalize_phone), kept in sync by the mapper event below;
+    # unique, so one customer per phone number
+    phone_normalized = db.Column(db.String(20))
+    jobs = db.relationship('Job', backref='customer', cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.Index('ix_customer_phone', 'phone'),
+        db.Index('ix_customer_phone_normalized', 'phone_normalized', unique=True),
+    )
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+
+    # spreadsheet-like fields
+    area = db.Column(db.String(200))
+    tv_model = db.Column(db.String(300))
+    repair_work = db.Column(db.Text)
+    amount_charged = db.Column(db.Float, default=0.0)
+    expense = db.Column(db.Float, default=0.0)  # job-level expense
+    payment_mode = db.Column(db.String(50))
+    pickup_date = db.Column(db.String(50))
+    note = db.Column(db.Text)
+    status = db.Column(db.String(50), default='received')  # received, in_progress, completed
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    # onupdate also applies to the Core UPDATEs (balances, merges), so payments move it too
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # id the mobile app gives a job it queued offline, so a resent batch does not create it twice
+    client_ref = db.Column(db.String(64))
+
+    # denormalized from payments; maintained by the Payment mapper events below
+    paid_total = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    balance_due = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+
+    payments = db.relationship('Payment', backref='job', cascade="all, delete-orphan")
+
+    # keyset pagination on /jobs seeks on (created_at, id); search filters on the rest. ids are
+    # never reused (AUTOINCREMENT on SQLite): archived jobs keep theirs, so a new job must not get one
+    __table_args__ = (
+        db.Index('ix_job_created_at_id', 'created_at', 'id'),
+        db.Index('ix_job_customer_created', 'customer_id', 'created_at', 'id'),
+        db.Index('ix_job_status_created_at', 'status', 'created_at'),
+        db.Index('ix_job_balance_due', 'balance_due'),
+        db.Index('ix_job_completed_at', 'completed_at'),
+        db.Index('ix_job_client_ref', 'client_ref', unique=True),
+        {'sqlite_autoincrement': True},
+    )
+
+    archived = False
+
+    @property
+    def profit(self):
+        return (self.amount_charged or 0.0) - (self.expense or 0.0)
+
+class Payment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    payment_mode = db.Column(db.String(50))
+    note = db.Column(db.String(200))
+    payment_date = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # ids are never reused, like Job's: archived payments keep theirs
+    __table_args__ = (
+        db.Index('ix_payment_job_id', 'job_id'),
+        db.Index('ix_payment_payment_date', 'payment_date'),
+        {'sqlite_autoincrement': True},
+    )
+
+# --- cold storage: completed, fully paid jobs past ARCHIVE_AFTER_DAYS and their payments are moved
+# here by `flask archive-jobs`. Same columns (and ids) as job/payment; read-only, looked up by
+# job_detail/invoices/exports/reports when the hot tables miss ---
+class JobArchive(db.Model):
+    __tablename__ = 'job_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    area = db.Column(db.String(200))
+    tv_model = db.Column(db.String(300))
+    repair_work = db.Column(db.Text)
+    amount_charged = db.Column(db.Float, default=0.0)
+    expense = db.Column(db.Float, default=0.0)
+    payment_mode = db.Column(db.String(50))
+    pickup_date = db.Column(db.String(50))
+    note = db.Column(db.Text)
+    status = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    client_ref = db.Column(db.String(64))
+    paid_total = db.Column(db.Float, nullable=False, default=0.0)
+    balance_due = db.Column(db.Float, nullable=False, default=0.0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    customer = db.relationship('Customer')
+    payments = db.relationship('PaymentArchive', backref='job')
+
+    __table_args__ = (
+        db.Index('ix_job_archive_customer_created', 'customer_id', 'created_at', 'id'),
+        db.Index('ix_job_archive_created_at_id', 'created_at', 'id'),
+        db.Index('ix_job_archive_completed_at', 'completed_at'),
+    )
+
+    archived = True
+    profit = Job.profit
+
+class PaymentArchive(db.Model):
+    __tablename__ = 'payment_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('job_archive.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    payment_mode = db.Column(db.String(50))
+    note = db.Column(db.String(200))
+    payment_date = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_payment_archive_job_id', 'job_id'),
+        db.Index('ix_payment_archive_payment_date', 'payment_date'),
+    )
+
+def get_job_or_404(job_id):
+    # hot table first, then the archive
+    job = db.session.get(Job, job_id) or db.session.get(JobArchive, job_id)
+    if job is None:
+        abort(404)
+    return job
+
+@event.listens_for(Customer, 'before_insert')
+@event.listens_for(Customer, 'before_update')
+def _customer_phone_key(mapper, conn, target):
+    target.phone_normalized = normalize_phone(target.phone)
+
+# --- NEW: Expense model ---
+class Expense(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(300))
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    date = db.Column(db.Date, default=date.today)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_expense_date', 'date'),)
+
+# --- bulk import progress, keyed by the sha256 of the uploaded file (makes imports resumable) ---
+class ImportCheckpoint(db.Model):
+    file_hash = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(300))
+    kind = db.Column(db.String(20))
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# --- Daily ledger: per-day rollup maintained on every insert/update/delete ---
+class DailyLedger(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    payments_total = db.Column(db.Float, nullable=False, default=0.0)
+    payments_count = db.Column(db.Integer, nullable=False, default=0)
+    jobs_amount_total = db.Column(db.Float, nullable=False, default=0.0)
+    jobs_expense_total = db.Column(db.Float, nullable=False, default=0.0)
+    jobs_completed_count = db.Column(db.Integer, nullable=False, default=0)
+    expenses_total = db.Column(db.Float, nullable=False, default=0.0)
+    expenses_count = db.Column(db.Integer, nullable=False, default=0)
+
+LEDGER_COLUMNS = ('payments_total', 'payments_count', 'jobs_amount_total', 'jobs_expense_total',
+                  'jobs_completed_count', 'expenses_total', 'expenses_count')
+
+# --- write counter: bumped in the same transaction as any write to jobs/payments/expenses, so
+# caches in every worker can tell whether what they hold is still current ---
+class DataVersion(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def bump_data_version(conn, name='reports'):
+    t = DataVersion.__table__
+    if conn.execute(t.update().where(t.c.name == name).values(version=t.c.version + 1)).rowcount == 0:
+        conn.execute(t.insert().values(name=name, version=1))
+
+def data_version(name='reports'):
+    return db.session.execute(select(DataVersion.version).where(DataVersion.name == name)).scalar() or 0
+
+def data_versions(*names):
+    # ((name, version), ...) and the latest bump among them, for HTTP validators
+    rows = {r.name: r for r in db.session.execute(
+        select(DataVersion.name, DataVersion.version, DataVersion.updated_at).where(DataVersion.name.in_(names)))}
+    versions = tuple((n, rows[n].version if n in rows else 0) for n in names)
+    stamps = [r.updated_at for r in rows.values() if r.updated_at]
+    return versions, max(stamps) if stamps else None
+
+# --- outbox behind the live event feed (/events): rows are written in the same transaction as the
+# change they describe, so every worker's poller sees exactly the committed events ---
+class EventOutbox(db.Model):
+    __tablename__ = 'event_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # ids must never be reused after pruning; clients resume from the last id they saw
+    __table_args__ = {'sqlite_autoincrement': True}
+
+def _as_day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+# each source maps a row (ORM object or Core row) to (day, {ledger column: amount})
+def payment_contribution(r):
+    return _as_day(r.payment_date), {'payments_total': r.amount or 0.0, 'payments_count': 1}
+
+def job_contribution(r):
+    if r.completed_at is None:
+        return None, {}
+    return _as_day(r.completed_at), {'jobs_amount_total': r.amount_charged or 0.0, 'jobs_expense_total': r.expense or 0.0, 'jobs_completed_count': 1}
+
+def expense_contribution(r):
+    return _as_day(r.date), {'expenses_total': r.amount or 0.0, 'expenses_count': 1}
+
+LEDGER_SOURCES = [
+    (Payment, ('amount', 'payment_date'), payment_contribution),
+    (Job, ('completed_at', 'amount_charged', 'expense'), job_contribution),
+    (Expense, ('amount', 'date'), expense_contribution),
+]
+
+def ledger_apply(conn, contribution, sign=1):
+    ledger_apply_many(conn, [contribution], sign)
+
+def ledger_apply_many(conn, contributions, sign=1):
+    # sum contributions per day first, then one executemany upsert adding the deltas
+    per_day = {}
+    for day, deltas in contributions:
+        if day is None or not deltas:
+            continue
+        totals = per_day.setdefault(day, dict.fromkeys(LEDGER_COLUMNS, 0))
+        for k, v in deltas.items():
+            totals[k] += sign * v
+    if not per_day:
+        return
+    rows = [dict(day=day, **totals) for day, totals in per_day.items()]
+    t = DailyLedger.__table__
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert if conn.dialect.name == 'sqlite' else postgresql.insert)(t)
+        stmt = stmt.on_conflict_do_update(index_elements=[t.c.day],
+                                          set_={k: t.c[k] + stmt.excluded[k] for k in LEDGER_COLUMNS})
+        conn.execute(stmt, rows)
+        return
+    for row in rows:
+        increments = {k: t.c[k] + row[k] for k in LEDGER_COLUMNS}
+        if conn.execute(t.update().where(t.c.day == row['day']).values(**increments)).rowcount == 0:
+            conn.execute(t.insert().values(**row))
+
+def register_ledger_source(model, fields, contribution):
+    t = model.__table__
+
+    def old_row(conn, target):
+        return conn.execute(select(*[t.c[f] for f in fields]).where(t.c.id == target.id)).first()
+
+    def after_insert(mapper, conn, target):
+        ledger_apply(conn, contribution(target))
+
+    def before_update(mapper, conn, target):
+        state = inspect(target)
+        if not any(state.attrs[f].history.has_changes() for f in fields):
+            return
+        old = old_row(conn, target)
+        if old is not None:
+            ledger_apply(conn, contribution(old), -1)
+        ledger_apply(conn, contribution(target))
+
+    def before_delete(mapper, conn, target):
+        old = old_row(conn, target)
+        if old is not None:
+            ledger_apply(conn, contribution(old), -1)
+
+    event.listen(model, 'after_insert', after_insert)
+    event.listen(model, 'before_update', before_update)
+    event.listen(model, 'before_delete', before_delete)
+
+for _model, _fields, _contribution in LEDGER_SOURCES:
+    register_ledger_source(_model, _fields, _contribution)
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_data_versions(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    models = tuple(m for m, _, _ in LEDGER_SOURCES)
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if any(isinstance(o, models) for o in changed):
+        bump_data_version(session.connection())
+    # customer names/phones show up in job exports
+    if any(isinstance(o, Customer) for o in changed):
+        bump_data_version(session.connection(), 'customers')
+
+EVENT_KINDS = ('job_created', 'payment_added', 'job_completed', 'expense_added')
+EVENT_OUTBOX_LOCK = 72011  # pg advisory lock key: outbox ids commit in id order
+EVENTS_PRUNE_EVERY = 200  # events written by this process between deletes of expired outbox rows
+_outbox_writes = 0
+
+def flush_events(session):
+    # (kind, data) for what this flush adds, in EVENT_KINDS order
+    events = []
+    for o in session.new:
+        if isinstance(o, Job):
+            customer = o.__dict__.get('customer')  # only if already loaded; no SQL mid-flush
+            events.append(('job_created', o.id, {
+                'job_id': o.id, 'customer_id': o.customer_id, 'customer_name': customer.name if customer else None,
+                'tv_model': o.tv_model, 'amount_charged': float(o.amount_charged or 0.0), 'status': o.status}))
+        elif isinstance(o, Payment):
+            events.append(('payment_added', o.id, {'payment_id': o.id, 'job_id': o.job_id, 'amount': float(o.amount or 0.0),
+                                                   'payment_mode': o.payment_mode}))
+        elif isinstance(o, Expense):
+            events.append(('expense_added', o.id, {'expense_id': o.id, 'description': o.description,
+                                                   'amount': float(o.amount or 0.0),
+                                                   'date': o.date.isoformat() if o.date else None}))
+    for o in session.dirty:
+        if isinstance(o, Job) and o.status == 'completed' and inspect(o).attrs.status.history.has_changes():
+            events.append(('job_completed', o.id, {'job_id': o.id, 'completed_at': o.completed_at.isoformat() if o.completed_at else None}))
+    events.sort(key=lambda e: (EVENT_KINDS.index(e[0]), e[1]))
+    return [(kind, data) for kind, _, data in events]
+
+@event.listens_for(db.session, 'after_flush')
+def _write_outbox(session, flush_context):
+    global _outbox_writes
+    events = flush_events(session)
+    if not events:
+        return
+    conn = session.connection()
+    if conn.dialect.name == 'postgresql':
+        # otherwise a transaction holding a lower id could commit after a poller moved past it
+        # (SQLite writers are serialized already)
+        conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({EVENT_OUTBOX_LOCK})")
+    now = datetime.utcnow()
+    conn.execute(EventOutbox.__table__.insert(), [
+        {'kind': kind, 'data': json.dumps(dict(data, at=now.isoformat())), 'created_at': now} for kind, data in events])
+    session.info['events_written'] = True
+    _outbox_writes += len(events)
+    if _outbox_writes >= EVENTS_PRUNE_EVERY:
+        _outbox_writes = 0
+        cutoff = now - timedelta(hours=current_app.config['EVENTS_RETENTION_HOURS'])
+        conn.execute(EventOutbox.__table__.delete().where(EventOutbox.created_at < cutoff))
+
+def local_day(col, minutes=0):
+    # calendar day of a (naive UTC) datetime column shifted by a fixed UTC offset in minutes
+    if not minutes:
+        return func.date(col)
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(col, f"{minutes:+d} minutes")
+    return func.date(col + timedelta(minutes=minutes))
+
+def source_day_totals(start=None, end=None, segments=None):
+    """{day: {ledger column: value}} straight from payments/jobs/expenses (archived ones included) for days [start, end].
+
+    Days are UTC unless `segments` [(utc from, utc to, UTC offset in minutes)] is given, which buckets
+    payments and completed jobs by local day (see offset_segments). Expense dates are calendar dates
+    already and are never shifted. Uses sargable ranges on the raw datetime columns.
+    """
+    if segments is None:
+        segments = [(datetime.combine(start, datetime.min.time()) if start else None,
+                     datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None, 0)]
+
+    def in_range(col, lo, hi):
+        return ([col >= lo] if lo else []) + ([col < hi] if hi else [])
+
+    queries = []
+    for lo, hi, minutes in segments:
+        for job_model, payment_model in ((Job, Payment), (JobArchive, PaymentArchive)):
+            payment_day, job_day = local_day(payment_model.payment_date, minutes), local_day(job_model.completed_at, minutes)
+            queries += [
+                (db.session.query(payment_day, func.sum(payment_model.amount), func.count(payment_model.id))
+                 .filter(*in_range(payment_model.payment_date, lo, hi)).group_by(payment_day),
+                 ('payments_total', 'payments_count')),
+                (db.session.query(job_day, func.sum(job_model.amount_charged), func.sum(job_model.expense), func.count(job_model.id))
+                 .filter(job_model.completed_at != None, *in_range(job_model.completed_at, lo, hi)).group_by(job_day),
+                 ('jobs_amount_total', 'jobs_expense_total', 'jobs_completed_count')),
+            ]
+    queries.append(
+        (db.session.query(Expense.date, func.sum(Expense.amount), func.count(Expense.id))
+         .filter(*([Expense.date >= start] if start else []), *([Expense.date <= end] if end else []))
+         .group_by(Expense.date),
+         ('expenses_total', 'expenses_count')))
+    days = {}
+    for q, cols in queries:
+        for day, *values in q:
+            if day is None:
+                continue
+            day = day if isinstance(day, date) else date.fromisoformat(str(day))
+            totals = days.setdefault(day, dict.fromkeys(LEDGER_COLUMNS, 0))
+            for c, v in zip(cols, values):
+                totals[c] += v or 0
+    return days
+
+def rebuild_daily_ledger(start=None, end=None):
+    # recompute ledger rows for [start, end] (whole history if omitted) from the source tables
+    days = source_day_totals(start, end)
+    q = DailyLedger.query
+    if start:
+        q = q.filter(DailyLedger.day >= start)
+    if end:
+        q = q.filter(DailyLedger.day <= end)
+    q.delete(synchronize_session=False)
+    if days:
+        db.session.execute(DailyLedger.__table__.insert(), [dict(day=d, **v) for d, v in days.items()])
+    bump_data_version(db.session.connection())
+    db.session.commit()
+    return len(days)
+
+# --- Job.paid_total / Job.balance_due: applied as SQL increments in the flush transaction ---
+def job_balance_apply(conn, job_id, amount):
+    job_balance_apply_many(conn, {job_id: amount})
+
+def job_balance_apply_many(conn, amounts):
+    # amounts: {job_id: paid delta}; a single executemany UPDATE
+    rows = [{'b_id': job_id, 'b_amount': amount} for job_id, amount in amounts.items() if job_id is not None and amount]
+    if not rows:
+        return
+    t = Job.__table__
+    conn.execute(t.update().where(t.c.id == bindparam('b_id'))
+                 .values(paid_total=t.c.paid_total + bindparam('b_amount'),
+                         balance_due=t.c.balance_due - bindparam('b_amount')), rows)
+
+def _touch_job_balance(target, job_id):
+    # the UPDATE bypasses the ORM, so the in-session Job is expired after the flush
+    session = object_session(target)
+    if session is not None and job_id is not None:
+        session.info.setdefault('balance_jobs', set()).add(job_id)
+
+@event.listens_for(Payment, 'after_insert')
+def _payment_balance_insert(mapper, conn, target):
+    job_balance_apply(conn, target.job_id, target.amount or 0.0)
+    _touch_job_balance(target, target.job_id)
+
+@event.listens_for(Payment, 'before_update')
+def _payment_balance_update(mapper, conn, target):
+    state = inspect(target)
+    if not (state.attrs.amount.history.has_changes() or state.attrs.job_id.history.has_changes()):
+        return
+    t = Payment.__table__
+    old = conn.execute(select(t.c.job_id, t.c.amount).where(t.c.id == target.id)).first()
+    if old is not None:
+        job_balance_apply(conn, old.job_id, -(old.amount or 0.0))
+        _touch_job_balance(target, old.job_id)
+    job_balance_apply(conn, target.job_id, target.amount or 0.0)
+    _touch_job_balance(target, target.job_id)
+
+@event.listens_for(Payment, 'before_delete')
+def _payment_balance_delete(mapper, conn, target):
+    t = Payment.__table__
+    old = conn.execute(select(t.c.job_id, t.c.amount).where(t.c.id == target.id)).first()
+    if old is not None:
+        job_balance_apply(conn, old.job_id, -(old.amount or 0.0))
+        _touch_job_balance(target, old.job_id)
+
+@event.listens_for(Job, 'before_insert')
+def _job_balance_insert(mapper, conn, target):
+    target.paid_total = target.paid_total or 0.0
+    target.balance_due = (target.amount_charged or 0.0) - target.paid_total
+
+@event.listens_for(Job, 'before_update')
+def _job_balance_update(mapper, conn, target):
+    if inspect(target).attrs.amount_charged.history.has_changes():
+        target.balance_due = (target.amount_charged or 0.0) - Job.__table__.c.paid_total
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _expire_job_balances(session, flush_context):
+    for job_id in session.info.pop('balance_jobs', ()):
+        job = session.identity_map.get(identity_key(Job, job_id))
+        if job is not None:
+            session.expire(job, ['paid_total', 'balance_due'])
+
+def job_balance_mismatches(job_ids=None):
+    # jobs whose stored paid_total/balance_due disagree with their payments
+    actual = (select(func.coalesce(func.sum(Payment.amount), 0.0))
+              .where(Payment.job_id == Job.id).correlate(Job).scalar_subquery())
+    q = (select(Job.id, Job.paid_total, Job.balance_due, actual.label('actual_paid'),
+                (func.coalesce(Job.amount_charged, 0.0) - actual).label('actual_balance'))
+         .where(or_(func.abs(Job.paid_total - actual) > 0.005,
+                    func.abs(Job.balance_due - (func.coalesce(Job.amount_charged, 0.0) - actual)) > 0.005)))
+    if job_ids is not None:
+        q = q.where(Job.id.in_(job_ids))
+    return db.session.execute(q).all()
+
+def recompute_job_balances(job_ids=None):
+    # set paid_total/balance_due from payments for the given jobs (all jobs if None)
+    t = Job.__table__
+    actual = (select(func.coalesce(func.sum(Payment.__table__.c.amount), 0.0))
+              .where(Payment.__table__.c.job_id == t.c.id).scalar_subquery())
+    stmt = t.update().values(paid_total=actual, balance_due=func.coalesce(t.c.amount_charged, 0.0) - actual)
+    if job_ids is not None:
+        stmt = stmt.where(t.c.id.in_(job_ids))
+    bump_data_version(db.session.connection())
+    return db.session.execute(stmt).rowcount
+
+# case-insensitive prefix search (lower(col) range scans) for the search endpoints; on Postgres
+# migration 15 rebuilds these and ix_customer_phone_normalized in the "C" collation (see jobs.prefix_range)
+db.Index('ix_customer_name_lower', func.lower(Customer.name))
+db.Index('ix_job_tv_model_lower', func.lower(Job.tv_model))
+db.Index('ix_job_area_lower', func.lower(Job.area))
+
+# HELPERS
+def normalize_phone(raw):
+    # digits only, last 10 (drops +91 / leading 0); None when there are no digits
+    digits = ''.join(ch for ch in str(raw or '') if ch.isdigit())
+    return digits[-10:] or None
+
+def find_or_create_customer(name, phone=None, address=None):
+    """The customer with this phone number, or a new one; returns (customer, created).
+
+    A concurrent insert of the same number fails the flush with IntegrityError; run callers
+    through commit_unit, which retries the whole unit and then finds that customer.
+    """
+    key = normalize_phone(phone)
+    if key:
+        customer = Customer.query.filter_by(phone_normalized=key).first()
+        if customer is not None:
+            if address and not customer.address:
+                customer.address = address
+            return customer, False
+    customer = Customer(name=name, phone=phone, address=address)
+    db.session.add(customer)
+    db.session.flush()
+    return customer, True
+
+def commit_unit(work, retries=1):
+    """Run work() and commit it as one transaction; returns its result.
+
+    On IntegrityError (another request inserted the same phone number or client_ref first) the
+    whole unit is rolled back and run again, so the retry finds the row that won.
+    """
+    for attempt in range(retries + 1):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == retries:
+                raise
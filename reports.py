@@ -0,0 +1,523 @@
+"""Report routes: the summary APIs and CSV/XLSX reports, and the job exports (streamed CSV, XLSX in the background)."""
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import (Blueprint, Response, abort, current_app, jsonify, redirect, render_template, request, send_file,
+                   stream_with_context, url_for)
+from sqlalchemy import func, select, union_all
+
+from caching import LRUCache, conditional, deploy_stamp
+from jobs import parse_date_arg
+from models import (Customer, DailyLedger, Job, JobArchive, LEDGER_COLUMNS, Payment, PaymentArchive, data_version,
+                    data_versions, db, source_day_totals)
+
+bp = Blueprint('reports', __name__)
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_MAX_AGE_HOURS = 24
+# a pending/running background job whose status file has not been touched for this long died with its worker
+BACKGROUND_STALE_SECONDS = 120
+
+# one engine behind every summary endpoint: any [start, end] range of local days, bucketed by day,
+# week (Mon-Sun) or month in a local timezone, plus (for /api/report and report.xlsx only; they
+# scan the raw rows of the whole range) breakdowns by payment mode, area and status. The computed
+# result is rendered as JSON, CSV or XLSX and memoized per (range, granularity, tz, breakdowns)
+# until the next write (see DataVersion).
+REPORT_GRANULARITIES = ('day', 'week', 'month')
+REPORT_MAX_DAYS = 3660  # ten years; a longer daily range is megabytes per response
+REPORT_HEADERS = ['Period', 'Start', 'End', 'Payments', '#payments', 'Jobs amount', 'Jobs expense', 'Profit',
+                  '#jobs', 'Expenses', '#expenses', 'Net profit']
+REPORT_VALUE_KEYS = ('payments_total', 'payments_count', 'jobs_amount_total', 'jobs_expense_total', 'jobs_profit_total',
+                     'jobs_completed_count', 'expenses_total', 'expenses_count', 'net_profit_total')
+
+_report_cache = LRUCache(0)  # sized by REPORT_CACHE_SIZE when the blueprint is registered
+
+@bp.record_once
+def _size_report_cache(state):
+    _report_cache.maxsize = state.app.config['REPORT_CACHE_SIZE']
+
+def report_timezone(name=None):
+    name = name or current_app.config['REPORT_TIMEZONE']
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        abort(400, f"Unknown timezone: {name}")
+
+def local_midnight_utc(d, tz):
+    # naive UTC datetime of local midnight starting day d (what the datetime columns store)
+    return datetime.combine(d, datetime.min.time(), tzinfo=tz).astimezone(timezone.utc).replace(tzinfo=None)
+
+def utc_offset_minutes(utc, tz):
+    return int(utc.replace(tzinfo=timezone.utc).astimezone(tz).utcoffset().total_seconds() // 60)
+
+def offset_segments(start, end, tz):
+    # [(utc from, utc to, UTC offset in minutes)] covering local days [start, end], split exactly at DST changes
+    lo, hi = local_midnight_utc(start, tz), local_midnight_utc(end + timedelta(days=1), tz)
+    segments = []
+    seg_start, minutes = lo, utc_offset_minutes(lo, tz)
+    t = lo
+    while t < hi:
+        step = min(t + timedelta(days=1), hi)
+        if utc_offset_minutes(step, tz) != minutes:
+            # bisect to the second the offset changes
+            a, b = 0, int((step - t).total_seconds())
+            while b - a > 1:
+                mid = (a + b) // 2
+                if utc_offset_minutes(t + timedelta(seconds=mid), tz) == minutes:
+                    a = mid
+                else:
+                    b = mid
+            change = t + timedelta(seconds=b)
+            segments.append((seg_start, change, minutes))
+            seg_start, minutes = change, utc_offset_minutes(change, tz)
+        t = step
+    segments.append((seg_start, hi, minutes))
+    return segments
+
+def report_day_totals(start, end, tz):
+    # UTC days come from the daily_ledger rollup; other zones regroup the source rows by local day
+    segments = offset_segments(start, end, tz)
+    if all(minutes == 0 for _, _, minutes in segments):
+        rows = DailyLedger.query.filter(DailyLedger.day >= start, DailyLedger.day <= end)
+        return {r.day: {k: getattr(r, k) for k in LEDGER_COLUMNS} for r in rows}
+    return source_day_totals(start, end, segments)
+
+def bucket_bounds(d, granularity):
+    if granularity == 'week':
+        first = d - timedelta(days=d.weekday())
+        return first, first + timedelta(days=6)
+    if granularity == 'month':
+        first = d.replace(day=1)
+        return first, (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return d, d
+
+def report_row(totals):
+    row = {k: totals.get(k, 0) for k in LEDGER_COLUMNS}
+    for k in LEDGER_COLUMNS:
+        row[k] = int(row[k] or 0) if k.endswith('_count') else float(row[k] or 0.0)
+    row['jobs_profit_total'] = row['jobs_amount_total'] - row['jobs_expense_total']
+    row['net_profit_total'] = row['jobs_profit_total'] - row['expenses_total']
+    return row
+
+def report_breakdowns(start, end, tz):
+    # whole-range breakdowns; exact local-day bounds, so no offset bucketing needed
+    lo, hi = local_midnight_utc(start, tz), local_midnight_utc(end + timedelta(days=1), tz)
+
+    def hot_and_archived(columns, date_column, models):
+        # the same rows from the hot table and its archive, restricted to the range
+        return union_all(*(select(*(getattr(m, c) for c in columns))
+                           .where(getattr(m, date_column) >= lo, getattr(m, date_column) < hi)
+                           for m in models)).subquery()
+
+    p = hot_and_archived(('payment_mode', 'amount'), 'payment_date', (Payment, PaymentArchive))
+    by_mode = db.session.execute(select(p.c.payment_mode, func.sum(p.c.amount), func.count()).group_by(p.c.payment_mode))
+    done = hot_and_archived(('area', 'amount_charged', 'expense'), 'completed_at', (Job, JobArchive))
+    by_area = db.session.execute(select(done.c.area, func.count(), func.sum(done.c.amount_charged), func.sum(done.c.expense))
+                                 .group_by(done.c.area))
+    # status is about jobs taken in during the range (completed ones are in the area breakdown)
+    taken = hot_and_archived(('status', 'amount_charged', 'balance_due'), 'created_at', (Job, JobArchive))
+    by_status = db.session.execute(select(taken.c.status, func.count(), func.sum(taken.c.amount_charged),
+                                          func.sum(taken.c.balance_due)).group_by(taken.c.status))
+    return {
+        'payment_mode': sorted(({'payment_mode': mode, 'payments_total': float(total or 0.0), 'payments_count': n}
+                                for mode, total, n in by_mode), key=lambda r: -r['payments_total']),
+        'area': sorted(({'area': area, 'jobs_completed_count': n, 'jobs_amount_total': float(amount or 0.0),
+                         'jobs_expense_total': float(expense or 0.0),
+                         'jobs_profit_total': float(amount or 0.0) - float(expense or 0.0)}
+                        for area, n, amount, expense in by_area), key=lambda r: -r['jobs_amount_total']),
+        'status': sorted(({'status': status, 'jobs_count': n, 'jobs_amount_total': float(amount or 0.0),
+                           'balance_due_total': float(due or 0.0)}
+                          for status, n, amount, due in by_status), key=lambda r: -r['jobs_count']),
+    }
+
+def compute_report(start, end, granularity, tz, breakdowns=False):
+    days = report_day_totals(start, end, tz)
+    buckets = []
+    d = start
+    while d <= end:
+        first, last = bucket_bounds(d, granularity)
+        last = min(last, end)
+        totals = dict.fromkeys(LEDGER_COLUMNS, 0)
+        while d <= last:
+            for k, v in days.get(d, {}).items():
+                totals[k] += v or 0
+            d += timedelta(days=1)
+        buckets.append(dict(period=first.isoformat(), start=max(first, start).isoformat(), end=last.isoformat(),
+                            **report_row(totals)))
+    range_totals = report_row({k: sum(b[k] for b in buckets) for k in LEDGER_COLUMNS})
+    report = {'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity,
+              'timezone': tz.key, 'buckets': buckets, 'totals': range_totals}
+    if breakdowns:
+        report['breakdowns'] = report_breakdowns(start, end, tz)
+    return report
+
+def build_report(start, end, granularity='day', tz=None, breakdowns=False):
+    """Report for local days [start, end]; served from the memo until the next write. Treat as read-only.
+
+    With breakdowns=True the result also has the whole-range breakdowns, which cost a scan of the
+    range's payments and jobs; the summary endpoints leave them out.
+    """
+    tz = tz or report_timezone()
+    key = (start, end, granularity, tz.key, breakdowns)
+    version = data_version()
+    hit = _report_cache.get(key)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    result = compute_report(start, end, granularity, tz, breakdowns)
+    _report_cache.put(key, (version, result))
+    return result
+
+def report_params(args, default_days=7):
+    # start/end (YYYY-MM-DD, local days) or the last `days` days ending today; granularity; tz
+    tz = report_timezone(args.get('tz'))
+    granularity = args.get('granularity', 'day')
+    if granularity not in REPORT_GRANULARITIES:
+        abort(400, f"granularity must be one of {', '.join(REPORT_GRANULARITIES)}")
+    end = parse_date_arg(args.get('end'))
+    end = end.date() if end else datetime.now(tz).date()
+    start = parse_date_arg(args.get('start'))
+    if start:
+        start = start.date()
+    else:
+        try:
+            start = end - timedelta(days=max(int(args.get('days', default_days)), 1) - 1)
+        except (ValueError, OverflowError):
+            abort(400, "days must be a whole number of days")
+    if start > end:
+        abort(400, "start is after end")
+    if (end - start).days + 1 > REPORT_MAX_DAYS:
+        abort(400, f"ranges are limited to {REPORT_MAX_DAYS} days")
+    try:
+        # the UTC bounds of the range must exist too (e.g. end=9999-12-31 has no next midnight)
+        local_midnight_utc(start, tz), local_midnight_utc(end + timedelta(days=1), tz)
+    except OverflowError:
+        abort(400, "dates out of range")
+    return start, end, granularity, tz
+
+def report_from_args(args, default_days=7, breakdowns=False):
+    return build_report(*report_params(args, default_days), breakdowns=breakdowns)
+
+def report_stamp():
+    # the resolved range (default ranges move at local midnight) and the write counter
+    start, end, granularity, tz = report_params(request.args)
+    versions, last_write = data_versions('reports')
+    return (deploy_stamp(), start, end, granularity, tz.key, versions), last_write
+
+def report_csv_rows(report):
+    for b in report['buckets']:
+        yield [b['period'], b['start'], b['end']] + [f"{v:.2f}" if isinstance(v, float) else v
+                                                     for v in (b[k] for k in REPORT_VALUE_KEYS)]
+
+@bp.route('/api/report')
+@conditional(report_stamp)
+def api_report():
+    return jsonify(report_from_args(request.args, breakdowns=True))
+
+# daily summary API (original) -- same payloads as before, built by the report engine
+def legacy_summary_rows(report, with_expenses=False):
+    out = []
+    for b in report['buckets']:
+        row = {'date': b['start']}
+        row.update((k, b[k]) for k in ('payments_total', 'payments_count', 'jobs_amount_total',
+                                       'jobs_expense_total', 'jobs_profit_total', 'jobs_completed_count'))
+        if with_expenses:
+            row.update((k, b[k]) for k in ('expenses_total', 'expenses_count', 'net_profit_total'))
+        out.append(row)
+    return out
+
+@bp.route('/api/daily_summary')
+@conditional(report_stamp)
+def daily_summary():
+    report = report_from_args(request.args)
+    t = report['totals']
+    totals = {'range_payments_total': t['payments_total'], 'range_jobs_amount_total': t['jobs_amount_total'], 'range_jobs_expense_total': t['jobs_expense_total'], 'range_jobs_profit_total': t['jobs_profit_total']}
+    return jsonify({'summary': legacy_summary_rows(report), 'totals': totals})
+
+# ---- NEW: daily summary including expenses (non-destructive new endpoint) ----
+@bp.route('/api/daily_summary_with_expenses')
+@conditional(report_stamp)
+def daily_summary_with_expenses():
+    report = report_from_args(request.args)
+    t = report['totals']
+    totals = {
+        'range_payments_total': t['payments_total'],
+        'range_jobs_amount_total': t['jobs_amount_total'],
+        'range_jobs_expense_total': t['jobs_expense_total'],
+        'range_jobs_profit_total': t['jobs_profit_total'],
+        'range_expenses_total': t['expenses_total'],
+        'range_net_profit_total': t['net_profit_total']
+    }
+    return jsonify({'summary': legacy_summary_rows(report, with_expenses=True), 'totals': totals})
+
+JOB_EXPORT_HEADERS = ['JobID','Date','Customer','Phone','Area','TVModel','RepairWork','Charge','Expense','Profit','PaymentMode','Note','Status','Pickup','CompletedAt']
+
+def export_jobs_select(args):
+    # plain columns (no ORM objects, no per-row customer lazy load), filtered by created_at range and status;
+    # archived jobs are exported with the rest
+    start, end = parse_date_arg(args.get('start')), parse_date_arg(args.get('end'))
+    parts = []
+    for m in (Job, JobArchive):
+        q = (select(m.id, m.created_at, Customer.name, Customer.phone, m.area, m.tv_model, m.repair_work,
+                    m.amount_charged, m.expense, m.payment_mode, m.note, m.status, m.pickup_date, m.completed_at)
+             .join(Customer, m.customer_id == Customer.id))
+        if start:
+            q = q.where(m.created_at >= start)
+        if end:
+            q = q.where(m.created_at < end + timedelta(days=1))
+        if args.get('status'):
+            q = q.where(m.status == args['status'])
+        parts.append(q)
+    u = union_all(*parts).subquery()
+    return select(u).order_by(u.c.created_at.desc(), u.c.id.desc())
+
+def export_stamp():
+    # job exports change with any job/payment write and with customer edits
+    versions, last_write = data_versions('reports', 'customers')
+    return (deploy_stamp(), versions), last_write
+
+def iter_export_jobs(args):
+    # server-side cursor on Postgres; lazily fetched batches on SQLite
+    return db.session.execute(export_jobs_select(args).execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+def export_job_values(r):
+    charge, expense = r.amount_charged or 0.0, r.expense or 0.0
+    return [r.id, r.created_at.strftime('%Y-%m-%d %H:%M') if r.created_at else '', r.name, r.phone or '', r.area or '', r.tv_model or '', r.repair_work or '', charge, expense, charge - expense, r.payment_mode or '', r.note or '', r.status or '', r.pickup_date or '', r.completed_at.strftime('%Y-%m-%d %H:%M') if r.completed_at else '']
+
+def stream_csv(header, rows, chunk_rows=500):
+    # yields the CSV in chunks of a few hundred rows so the first byte goes out immediately
+    out = StringIO(); w = csv.writer(out)
+    w.writerow(header)
+    for i, row in enumerate(rows, 1):
+        w.writerow(row)
+        if i % chunk_rows == 0:
+            yield out.getvalue()
+            out.seek(0); out.truncate(0)
+    yield out.getvalue()
+
+def csv_download(rows_iter, header, filename):
+    return Response(stream_with_context(stream_csv(header, rows_iter)), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment;filename={filename}'})
+
+@bp.route('/daily_summary.csv')
+@conditional(report_stamp)
+def daily_summary_csv():
+    report = report_from_args(request.args)
+    rows = ([b['start'], f"{b['payments_total']:.2f}", b['payments_count'], f"{b['jobs_amount_total']:.2f}", f"{b['jobs_expense_total']:.2f}", f"{b['jobs_profit_total']:.2f}", b['jobs_completed_count']]
+            for b in report['buckets'])
+    return csv_download(rows, ['Date','Payments','#payments','Jobs amount','Jobs expense','Profit','#jobs'], 'daily_summary.csv')
+
+@bp.route('/report.csv')
+@conditional(report_stamp)
+def report_csv():
+    report = report_from_args(request.args)
+    return csv_download(report_csv_rows(report), REPORT_HEADERS,
+                        f"report_{report['granularity']}_{report['start']}_{report['end']}.csv")
+
+@bp.route('/export_jobs.csv')
+@conditional(export_stamp)
+def export_jobs_csv():
+    result = iter_export_jobs(request.args)
+
+    def rows():
+        for r in result:
+            v = export_job_values(r)
+            v[7:10] = [f"{x:.2f}" for x in v[7:10]]
+            yield v
+    return csv_download(rows(), JOB_EXPORT_HEADERS, 'jobs_export.csv')
+
+# ---- XLSX: openpyxl is imported on the first XLSX request, not when a worker boots ----
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# text columns are sized from the data; ids, dates and amounts get fixed widths
+XLSX_TEXT_COLUMNS = {2: 'name', 3: 'phone', 4: 'area', 5: 'tv_model', 6: 'repair_work', 10: 'payment_mode', 11: 'note', 12: 'status', 13: 'pickup_date'}
+XLSX_FIXED_WIDTHS = {0: 8, 1: 16, 7: 12, 8: 12, 9: 12, 14: 16}
+
+def xlsx_export_stats(args):
+    # row count and longest value per text column in one aggregate query; write-only sheets
+    # emit column widths before the first row, so they have to be known up front
+    sq = export_jobs_select(args).order_by(None).subquery()
+    cols = [func.count()] + [func.max(func.length(sq.c[name])) for name in XLSX_TEXT_COLUMNS.values()]
+    count, *lengths = db.session.execute(select(*cols).select_from(sq)).one()
+    widths = dict(XLSX_FIXED_WIDTHS)
+    widths.update({i: n or 0 for i, n in zip(XLSX_TEXT_COLUMNS, lengths)})
+    return count, widths
+
+def write_jobs_xlsx(args, target, widths, heartbeat=None):
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Jobs")
+    for i, header in enumerate(JOB_EXPORT_HEADERS):
+        ws.column_dimensions[get_column_letter(i + 1)].width = min(50, max(len(header), widths.get(i, 0)) + 2)
+    header_row = []
+    for header in JOB_EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=header); cell.font = Font(bold=True)
+        header_row.append(cell)
+    ws.append(header_row)
+    for i, r in enumerate(iter_export_jobs(args)):
+        if heartbeat is not None and i % EXPORT_BATCH_SIZE == 0:
+            heartbeat()
+        ws.append(export_job_values(r))
+    if heartbeat is not None:
+        heartbeat()
+    wb.save(target)
+
+# --- background jobs (XLSX exports here, web imports in importer.py) run one at a time on a thread and keep
+# their status in a JSON file so any worker can serve it. While this process has jobs queued or running it
+# keeps touching their status files; one that goes quiet for BACKGROUND_STALE_SECONDS was lost with its
+# worker (recycled, timed out) and reads as failed ---
+_background_executor = None
+_background_statuses = set()  # status files of the jobs queued or running in this process
+
+def background_executor():
+    global _background_executor
+    if _background_executor is None:
+        _background_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='background')
+    return _background_executor
+
+def write_status_file(path, **status):
+    tmp = f"{path}.part"
+    with open(tmp, 'w') as f:
+        json.dump(status, f)
+    os.replace(tmp, path)
+
+def read_status_file(path, interrupted):
+    try:
+        with open(path) as f:
+            status = json.load(f)
+        age = time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        abort(404)
+    if status['state'] in ('pending', 'running') and age > BACKGROUND_STALE_SECONDS:
+        status.update(state='failed', error=interrupted)
+    return status
+
+def touch_background_statuses():
+    for path in list(_background_statuses):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+def submit_background(status_path, fn, *args):
+    _background_statuses.add(status_path)
+    def run():
+        try:
+            fn(*args)
+        finally:
+            _background_statuses.discard(status_path)
+    background_executor().submit(run)
+
+def export_path(token, ext):
+    if not re.fullmatch(r'[0-9a-f]{32}', token):
+        abort(404)
+    return os.path.join(current_app.config['EXPORT_FOLDER'], f"{token}.{ext}")
+
+def write_export_status(token, **status):
+    write_status_file(export_path(token, 'json'), **status)
+
+def read_export_status(token):
+    return read_status_file(export_path(token, 'json'),
+                            'the export was interrupted (the server restarted); please start it again')
+
+def purge_old_exports():
+    cutoff = time.time() - EXPORT_MAX_AGE_HOURS * 3600
+    folder = current_app.config['EXPORT_FOLDER']
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def run_background_export(app, token, args, widths, rows):
+    with app.app_context():
+        write_export_status(token, state='running', rows=rows)
+        try:
+            part = export_path(token, 'xlsx.part')
+            write_jobs_xlsx(args, part, widths, heartbeat=touch_background_statuses)
+            os.replace(part, export_path(token, 'xlsx'))
+            write_export_status(token, state='done', rows=rows)
+        except Exception as exc:
+            current_app.logger.exception("Background XLSX export %s failed", token)
+            write_export_status(token, state='failed', rows=rows, error=str(exc))
+
+@bp.route('/export_jobs.xlsx')
+@conditional(export_stamp)
+def export_jobs_xlsx():
+    args = {k: request.args[k] for k in ('start', 'end', 'status') if request.args.get(k)}
+    rows, widths = xlsx_export_stats(args)
+    if rows <= current_app.config['XLSX_BACKGROUND_ROWS'] and not request.args.get('background'):
+        bio = BytesIO(); write_jobs_xlsx(args, bio, widths); bio.seek(0)
+        return send_file(bio, as_attachment=True, download_name='jobs.xlsx', mimetype=XLSX_MIMETYPE)
+
+    purge_old_exports()
+    token = uuid.uuid4().hex
+    write_export_status(token, state='pending', rows=rows)
+    submit_background(export_path(token, 'json'), run_background_export, current_app._get_current_object(),
+                      token, args, widths, rows)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'token': token, 'status_url': url_for('reports.api_export_status', token=token)}), 202
+    return redirect(url_for('reports.export_status', token=token))
+
+@bp.route('/exports/<token>')
+def export_status(token):
+    return render_template('export_status.html', token=token, status=read_export_status(token))
+
+@bp.route('/api/exports/<token>')
+def api_export_status(token):
+    status = read_export_status(token)
+    if status['state'] == 'done':
+        status['download_url'] = url_for('reports.export_download', token=token)
+    return jsonify(status)
+
+@bp.route('/exports/<token>/download')
+def export_download(token):
+    if read_export_status(token)['state'] != 'done':
+        abort(404)
+    return send_file(export_path(token, 'xlsx'), as_attachment=True, download_name='jobs.xlsx', mimetype=XLSX_MIMETYPE)
+
+@bp.route('/report.xlsx')
+@conditional(report_stamp)
+def report_xlsx():
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    report = report_from_args(request.args, breakdowns=True)
+    wb = openpyxl.Workbook(write_only=True)
+
+    def sheet(title, header, rows):
+        ws = wb.create_sheet(title)
+        for i, h in enumerate(header):
+            ws.column_dimensions[get_column_letter(i + 1)].width = max(len(h), 10) + 2
+        header_row = []
+        for h in header:
+            cell = WriteOnlyCell(ws, value=h); cell.font = Font(bold=True)
+            header_row.append(cell)
+        ws.append(header_row)
+        for row in rows:
+            ws.append(row)
+
+    t = report['totals']
+    sheet('Summary', REPORT_HEADERS,
+          [[b['period'], b['start'], b['end']] + [b[k] for k in REPORT_VALUE_KEYS] for b in report['buckets']]
+          + [['Total', report['start'], report['end']] + [t[k] for k in REPORT_VALUE_KEYS]])
+    for name, rows in report['breakdowns'].items():
+        keys = list(rows[0]) if rows else [name]
+        sheet(f"By {name.replace('_', ' ')}", keys, [[r[k] for k in keys] for r in rows])
+    bio = BytesIO(); wb.save(bio); bio.seek(0)
+    return send_file(bio, as_attachment=True, mimetype=XLSX_MIMETYPE,
+                     download_name=f"report_{report['granularity']}_{report['start']}_{report['end']}.xlsx")